@@ -0,0 +1,208 @@
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+import uuid
+from pathlib import Path
+from urllib.parse import unquote_to_bytes
+
+import metrics
+
+# Content-addressed store of decoded attachments ({sha256} -> bytes on disk), shared by all tasks
+ATTACHMENT_STORE_DIR = Path(os.getenv("ATTACHMENT_STORE_DIR", ".cache/attachments"))
+ATTACHMENT_PREVIEW_CHARS = int(os.getenv("ATTACHMENT_PREVIEW_CHARS", "300"))
+ATTACHMENT_PREVIEW_LINES = 5
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(20 * 1024 * 1024)))  # decoded size
+_CHUNK = 4 * 64 * 1024  # base64 chars decoded per write (multiple of 4)
+
+_TEXT_TYPES = {"application/json", "application/xml", "application/javascript", "image/svg+xml"}
+_UNSAFE = re.compile(r"[^\w.\- ]")
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+# keys of a stored reference; clients may not send them
+REFERENCE_KEYS = ("sha256", "mime", "size", "preview")
+
+
+def _path(sha):
+    if not isinstance(sha, str) or not _SHA256.fullmatch(sha):
+        raise ValueError(f"Not an attachment digest: {sha!r}")
+    return ATTACHMENT_STORE_DIR / sha[:2] / sha
+
+
+def _safe_name(name, sha):
+    name = _UNSAFE.sub("_", os.path.basename((name or "").strip())).strip(". ")
+    return name or f"attachment-{sha[:8]}"
+
+
+def _is_text(mime):
+    return mime.startswith("text/") or mime in _TEXT_TYPES
+
+
+class AttachmentTooLarge(ValueError):
+    pass
+
+
+class Stored(dict):
+    """A reference to decoded content in the store. Only Spool.commit() makes these, so a
+    payload can never pass off a dict of its own as one."""
+
+
+class Spool:
+    """
+    Decodes a data: URI fed in pieces into a temp file in the store, hashing as it goes,
+    so no more than a chunk of it is held in memory. commit() moves the file to its
+    content address; discard() drops it.
+    """
+
+    def __init__(self, max_bytes=ATTACHMENT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.mime = None
+        self._header = ""
+        self._base64 = None  # unknown until the header's comma has been seen
+        self._pending = ""  # base64 short of a 4-char group, or a split %XX escape
+        self._hasher = hashlib.sha256()
+        ATTACHMENT_STORE_DIR.mkdir(parents=True, exist_ok=True)
+        self._tmp = ATTACHMENT_STORE_DIR / f".{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp, "wb")
+
+    def feed(self, text):
+        # data:[<mime>][;base64],<data>
+        if self._base64 is None:
+            self._header += text
+            if "," not in self._header:
+                if len(self._header) > 1024:
+                    raise ValueError("data: URI header is too long")
+                return
+            header, _, text = self._header.partition(",")
+            self.mime = header[5:].split(";")[0].strip().lower()
+            self._base64 = ";base64" in header.lower()
+        if self._base64:
+            if any(c in text for c in " \n\r\t"):
+                text = re.sub(r"\s+", "", text)
+            data = self._pending + text
+            cut = len(data) - len(data) % 4
+            self._pending = data[cut:]
+            for i in range(0, cut, _CHUNK):
+                self._write(binascii.a2b_base64(data[i:min(i + _CHUNK, cut)]))
+        else:
+            data = self._pending + text
+            split = data.find("%", len(data) - 2)
+            cut = split if split >= 0 else len(data)
+            self._pending = data[cut:]
+            self._write(unquote_to_bytes(data[:cut]))
+
+    def _write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise AttachmentTooLarge(f"attachment exceeds {self.max_bytes} bytes")
+        self._hasher.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self, name):
+        """Stores the decoded file and returns its reference: {name, mime, size, sha256, preview}."""
+        try:
+            if self._base64 is None:
+                raise ValueError("data: URI has no ',' separator")
+            if self._pending:
+                self._write(binascii.a2b_base64(self._pending) if self._base64 else unquote_to_bytes(self._pending))
+                self._pending = ""
+            self._file.close()
+            sha = self._hasher.hexdigest()
+            target = _path(sha)
+            if target.exists():
+                metrics.inc("tds_attachments_total", result="deduplicated")
+            else:
+                target.parent.mkdir(exist_ok=True)
+                os.replace(self._tmp, target)
+                metrics.inc("tds_attachments_total", result="stored")
+        finally:
+            self.discard()
+
+        name = _safe_name(name, sha)
+        mime = self.mime or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return Stored(name=name, mime=mime, size=self.size, sha256=sha, preview=_preview(target, mime))
+
+    def discard(self):
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def store(attachment):
+    """
+    Decodes one {name, url} attachment into the store and returns its reference:
+    {name, mime, size, sha256, preview}. Identical content is stored once.
+    Attachments that are plain links (not data: URIs) are returned as {name, url},
+    and references that are already stored are returned as they are.
+    """
+    if isinstance(attachment, Stored):
+        return attachment
+    name, url = attachment.get("name"), attachment.get("url") or ""
+    if not url.startswith("data:"):
+        return {"name": name, "url": url}
+
+    spool = Spool()
+    try:
+        for i in range(0, len(url), _CHUNK):
+            spool.feed(url[i:i + _CHUNK])
+    except BaseException:
+        spool.discard()
+        raise
+    return spool.commit(name)
+
+
+def store_all(attachments):
+    """Stores every attachment; returns their references in order (undecodable ones are skipped)."""
+    refs = []
+    with metrics.span("attachments_store", count=len(attachments)):
+        for attachment in attachments:
+            try:
+                refs.append(store(attachment))
+            except (binascii.Error, ValueError) as e:
+                print(f"⚠️ Skipping attachment {attachment.get('name')}: {e}")
+    return refs
+
+
+def read(ref):
+    """Returns the stored bytes for a reference from store()."""
+    return _path(ref["sha256"]).read_bytes()
+
+
+def files_for_repo(refs):
+    """{filename: bytes} of the stored attachments, committed next to the generated app."""
+    return {ref["name"]: read(ref) for ref in refs if isinstance(ref, Stored)}
+
+
+def _preview(path, mime):
+    if not _is_text(mime):
+        return None
+    with open(path, "rb") as f:
+        head = f.read(ATTACHMENT_PREVIEW_CHARS * 4)
+    text = head.decode("utf-8", errors="ignore")
+    lines = [line[:120] for line in text.splitlines()[:ATTACHMENT_PREVIEW_LINES]]
+    return "\n".join(lines)[:ATTACHMENT_PREVIEW_CHARS]
+
+
+def _human_size(size):
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def describe(refs):
+    """One compact prompt line (plus an indented preview) per attachment."""
+    lines = []
+    for ref in refs:
+        if not isinstance(ref, Stored):
+            lines.append(f"- {ref['name']}: {ref['url']}")
+            continue
+        lines.append(f"- `{ref['name']}` ({ref['mime']}, {_human_size(ref['size'])})")
+        if ref.get("preview"):
+            lines.append("  Preview:")
+            lines.extend(f"      {line}" for line in ref["preview"].splitlines())
+    return "\n".join(lines)
+
+
+metrics.describe("tds_attachments_total", "counter", "Attachments written to the store or deduplicated")
@@ -0,0 +1,175 @@
+"""
+Batch submission: runs many task payloads through the job queue and
+yields per-task results as they finish.
+
+Replay a JSONL file of task payloads against a running server:
+
+    python batch.py tasks.jsonl --url http://127.0.0.1:8000 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import metrics
+
+# Nonces processed at the same time by one batch (rounds of a nonce always run in order)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_TASKS = int(os.getenv("BATCH_MAX_TASKS", "1000"))
+
+
+def parse_payloads(body):
+    """
+    Accepts a JSON array, {"tasks": [...]}, a single payload or JSONL
+    and returns the list of task payloads. Raises ValueError on bad input.
+    """
+    text = body.decode("utf-8") if isinstance(body, bytes) else body
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                data.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"line {number}: {e}")
+    if isinstance(data, dict):
+        data = data.get("tasks", [data])
+    if not isinstance(data, list) or not all(isinstance(p, dict) for p in data):
+        raise ValueError("expected task payload objects")
+    if len(data) > BATCH_MAX_TASKS:
+        raise ValueError(f"batch has {len(data)} tasks, the limit is {BATCH_MAX_TASKS}")
+    return data
+
+
+def _round(payload):
+    # a malformed round sorts first; validation rejects it before it runs
+    value = payload.get("round")
+    return value if isinstance(value, int) and not isinstance(value, bool) else 0
+
+
+def _chains(payloads):
+    # One chain per nonce, rounds in order; payloads without a nonce run on their own
+    chains = {}
+    for index, payload in enumerate(payloads):
+        key = payload.get("nonce") or f"#{index}"
+        chains.setdefault(key, []).append((index, payload))
+    for chain in chains.values():
+        chain.sort(key=lambda item: (_round(item[1]), item[0]))
+    return list(chains.values())
+
+
+def _result(index, payload, started, **fields):
+    return {
+        "index": index,
+        "task": payload.get("task"),
+        "nonce": payload.get("nonce"),
+        "round": payload.get("round"),
+        "elapsed": round(time.monotonic() - started, 3),
+        **fields,
+    }
+
+
+async def run_batch(payloads, run, concurrency=BATCH_CONCURRENCY, validate=None):
+    """
+    Runs `payloads` with at most `concurrency` nonces in flight and yields one
+    result dict per payload as it finishes, then a summary.
+    `run(payload)` executes one task and returns {job_id, status, result, error, ...};
+    `validate(payload)` returns an error message for payloads that must not run.
+    """
+    started = time.monotonic()
+    results = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_chain(chain):
+        failed_round = None
+        async with semaphore:
+            for index, payload in chain:
+                error = validate(payload) if validate else None
+                if error is None and failed_round is not None:
+                    error = f"skipped: round {failed_round} of this nonce failed"
+                if error:
+                    failed_round = failed_round or payload.get("round")
+                    await results.put(_result(index, payload, started, status="rejected", error=error))
+                    continue
+                try:
+                    outcome = await run(payload)
+                except Exception as e:
+                    outcome = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                if outcome["status"] != "succeeded":
+                    failed_round = payload.get("round")
+                await results.put(_result(index, payload, started, **outcome))
+
+    tasks = [asyncio.create_task(run_chain(chain)) for chain in _chains(payloads)]
+    counts = {"succeeded": 0, "failed": 0, "rejected": 0}
+    try:
+        for _ in range(len(payloads)):
+            result = await results.get()
+            counts[result["status"]] += 1
+            metrics.inc("tds_batch_tasks_total", status=result["status"])
+            yield result
+    finally:
+        # client went away: stop submitting (already queued jobs still run)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    yield {"done": True, "total": len(payloads), **counts, "elapsed": round(time.monotonic() - started, 3)}
+
+
+metrics.describe("tds_batch_tasks_total", "counter", "Batch tasks by final status")
+
+
+# --- CLI: replay a JSONL file against a running server ---
+async def replay(path, url, concurrency, secret=None, as_json=False):
+    import httpx  # only the CLI needs it
+
+    async def lines():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                if secret:
+                    line = json.dumps({**json.loads(line), "secret": secret}) + "\n"
+                yield line.encode("utf-8")
+
+    failed = 0
+    async with httpx.AsyncClient(timeout=None) as client:
+        async with client.stream(
+            "POST", f"{url.rstrip('/')}/batch", params={"concurrency": concurrency},
+            content=lines(), headers={"Content-Type": "application/x-ndjson"},
+        ) as response:
+            if response.status_code != 200:
+                print(f"❌ Batch rejected ({response.status_code}): {(await response.aread()).decode()}")
+                return 1
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                if as_json:
+                    print(line, flush=True)
+                elif result.get("done"):
+                    print(f"\n📊 {result['succeeded']}/{result['total']} succeeded, {result['failed']} failed, "
+                          f"{result['rejected']} rejected in {result['elapsed']}s")
+                elif result["status"] == "succeeded":
+                    print(f"✅ {result['task']} round {result['round']} ({result['elapsed']}s): "
+                          f"{(result['result'] or {}).get('pages_url')}", flush=True)
+                else:
+                    print(f"❌ {result['task']} round {result['round']}: {result['error']}", flush=True)
+                if result.get("status") in ("failed", "rejected"):
+                    failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a JSONL file of task payloads through POST /batch")
+    parser.add_argument("path", help="JSONL file, one task payload per line")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="nonces in flight")
+    parser.add_argument("--secret", default=None, help="replace the secret in every payload")
+    parser.add_argument("--json", action="store_true", help="print the raw NDJSON results")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(replay(args.path, args.url, args.concurrency, args.secret, args.json)))
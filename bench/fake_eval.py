@@ -0,0 +1,29 @@
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(failure_rate=0.0, seed=0):
+    """
+    Fake evaluation server. Fails a `failure_rate` fraction of notifications with a 500
+    and records when each (nonce, round) was first successfully notified.
+    """
+    app = FastAPI()
+    app.state.attempts = 0
+    app.state.failures = 0
+    app.state.received = {}
+    rng = random.Random(seed)
+
+    @app.post("/notify")
+    async def notify(request: Request):
+        body = await request.json()
+        app.state.attempts += 1
+        if rng.random() < failure_rate:
+            app.state.failures += 1
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+        app.state.received.setdefault((body.get("nonce"), body.get("round")), time.monotonic())
+        return {"status": "ok"}
+
+    return app
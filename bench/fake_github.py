@@ -0,0 +1,287 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def _sha(kind, data):
+    raw = data if isinstance(data, bytes) else json.dumps(data, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(b"%s %d\0" % (kind.encode(), len(raw)) + raw).hexdigest()
+
+
+def create_app(base_url, username="bench-user", rate_limit=5000, latency=0.0, rate_window=3600, build_time=0.0):
+    """
+    Minimal in-memory GitHub REST API: users, repos, contents, Git Data
+    (blobs/trees/commits/refs) and Pages, with X-RateLimit-* headers.
+    `base_url` is where this server is reachable (PyGithub follows the returned urls).
+    The `rate_limit` quota refills every `rate_window` seconds; a Pages build
+    takes `build_time` seconds after each push.
+    """
+    app = FastAPI()
+    app.state.calls = Counter()
+    app.state.rate_limited = 0
+    repos = {}
+    quota = {"remaining": rate_limit, "reset": int(time.time()) + rate_window}
+
+    def repo_json(name):
+        full = f"{username}/{name}"
+        return {
+            "id": abs(hash(full)) % 10**8, "name": name, "full_name": full, "private": False,
+            "owner": {"login": username, "url": f"{base_url}/users/{username}"},
+            "html_url": f"https://github.com/{full}", "url": f"{base_url}/repos/{full}",
+            "default_branch": "main",
+        }
+
+    def ref_json(name, repo):
+        return {
+            "ref": "refs/heads/main",
+            "url": f"{base_url}/repos/{username}/{name}/git/refs/heads/main",
+            "object": {"type": "commit", "sha": repo["head"],
+                       "url": f"{base_url}/repos/{username}/{name}/git/commits/{repo['head']}"},
+        }
+
+    def commit_json(name, repo, sha):
+        commit = repo["commits"][sha]
+        return {
+            "sha": sha, "message": commit["message"],
+            "url": f"{base_url}/repos/{username}/{name}/git/commits/{sha}",
+            "tree": {"sha": commit["tree"], "url": f"{base_url}/repos/{username}/{name}/git/trees/{commit['tree']}"},
+            "parents": [{"sha": p, "url": f"{base_url}/repos/{username}/{name}/git/commits/{p}"} for p in commit["parents"]],
+        }
+
+    def put_blob(repo, data):
+        sha = _sha("blob", data)
+        repo["blobs"][sha] = data
+        return sha
+
+    def put_tree(repo, entries):
+        sha = _sha("tree", entries)
+        repo["trees"][sha] = dict(entries)
+        return sha
+
+    def put_commit(repo, message, tree, parents):
+        sha = _sha("commit", {"message": message, "tree": tree, "parents": parents, "t": time.time()})
+        repo["commits"][sha] = {"message": message, "tree": tree, "parents": parents}
+        return sha
+
+    def commit_files(repo, files, message):
+        # contents API style: one commit per call on top of head
+        entries = dict(repo["trees"][repo["commits"][repo["head"]]["tree"]]) if repo["head"] else {}
+        for path, data in files.items():
+            entries[path] = put_blob(repo, data)
+        repo["head"] = put_commit(repo, message, put_tree(repo, entries), [repo["head"]] if repo["head"] else [])
+        return repo["head"]
+
+    def start_build(repo):
+        repo["builds"] += 1
+        repo["build"] = (repo["head"], time.time() + build_time)
+
+    def get_repo(name):
+        if name not in repos:
+            return None, JSONResponse({"message": "Not Found"}, status_code=404)
+        return repos[name], None
+
+    @app.middleware("http")
+    async def rate_limit_and_count(request: Request, call_next):
+        if latency:
+            await asyncio.sleep(latency)
+        app.state.calls[f"{request.method} {_route_name(request.url.path)}"] += 1
+        if time.time() >= quota["reset"]:
+            quota["remaining"] = rate_limit
+            quota["reset"] = int(time.time()) + rate_window
+        headers = {"X-RateLimit-Limit": str(rate_limit), "X-RateLimit-Reset": str(quota["reset"])}
+        if quota["remaining"] <= 0:
+            headers["X-RateLimit-Remaining"] = "0"
+            app.state.rate_limited += 1
+            return JSONResponse({"message": "API rate limit exceeded"}, status_code=403, headers=headers)
+        quota["remaining"] -= 1
+        response = await call_next(request)
+        headers["X-RateLimit-Remaining"] = str(quota["remaining"])
+        response.headers.update(headers)
+        return response
+
+    @app.get("/user")
+    async def user():
+        return {"login": username, "url": f"{base_url}/users/{username}", "type": "User"}
+
+    @app.post("/user/repos")
+    async def create_repo(request: Request):
+        body = await request.json()
+        name = body["name"]
+        if name in repos:
+            return JSONResponse(
+                {"message": "Repository creation failed.",
+                 "errors": [{"resource": "Repository", "field": "name", "message": "name already exists on this account"}]},
+                status_code=422,
+            )
+        repo = {"blobs": {}, "trees": {}, "commits": {}, "head": None, "pages": None, "builds": 0, "build": None}
+        repos[name] = repo
+        if body.get("auto_init"):
+            commit_files(repo, {"README.md": f"# {name}\n".encode()}, "Initial commit")
+        return JSONResponse(repo_json(name), status_code=201)
+
+    @app.get("/repos/{owner}/{name}")
+    async def read_repo(owner: str, name: str):
+        repo, error = get_repo(name)
+        return error or repo_json(name)
+
+    @app.get("/repos/{owner}/{name}/contents/{path:path}")
+    async def get_contents(owner: str, name: str, path: str):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        entries = repo["trees"][repo["commits"][repo["head"]]["tree"]] if repo["head"] else {}
+        if path not in entries:
+            return JSONResponse({"message": "Not Found"}, status_code=404)
+        data = repo["blobs"][entries[path]]
+        return {"type": "file", "path": path, "name": path.split("/")[-1], "sha": entries[path],
+                "encoding": "base64", "content": base64.b64encode(data).decode(), "size": len(data),
+                "url": f"{base_url}/repos/{owner}/{name}/contents/{path}"}
+
+    @app.put("/repos/{owner}/{name}/contents/{path:path}")
+    async def put_contents(owner: str, name: str, path: str, request: Request):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        body = await request.json()
+        sha = commit_files(repo, {path: base64.b64decode(body["content"])}, body.get("message", ""))
+        return JSONResponse({"content": {"path": path, "sha": _sha("blob", base64.b64decode(body["content"]))},
+                             "commit": commit_json(name, repo, sha)}, status_code=201)
+
+    @app.get("/repos/{owner}/{name}/git/ref/heads/{branch}")
+    @app.get("/repos/{owner}/{name}/git/refs/heads/{branch}")
+    async def get_ref(owner: str, name: str, branch: str):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        if not repo["head"]:
+            return JSONResponse({"message": "Git Repository is empty."}, status_code=409)
+        return ref_json(name, repo)
+
+    @app.patch("/repos/{owner}/{name}/git/refs/heads/{branch}")
+    async def update_ref(owner: str, name: str, branch: str, request: Request):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        body = await request.json()
+        repo["head"] = body["sha"]
+        if repo["pages"]:
+            start_build(repo)
+        return ref_json(name, repo)
+
+    @app.get("/repos/{owner}/{name}/git/commits/{sha}")
+    async def get_commit(owner: str, name: str, sha: str):
+        repo, error = get_repo(name)
+        return error or commit_json(name, repo, sha)
+
+    @app.post("/repos/{owner}/{name}/git/commits")
+    async def create_commit(owner: str, name: str, request: Request):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        body = await request.json()
+        sha = put_commit(repo, body["message"], body["tree"], body.get("parents", []))
+        return JSONResponse(commit_json(name, repo, sha), status_code=201)
+
+    @app.post("/repos/{owner}/{name}/git/blobs")
+    async def create_blob(owner: str, name: str, request: Request):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        body = await request.json()
+        data = base64.b64decode(body["content"]) if body.get("encoding") == "base64" else body["content"].encode()
+        sha = put_blob(repo, data)
+        return JSONResponse({"sha": sha, "url": f"{base_url}/repos/{owner}/{name}/git/blobs/{sha}"}, status_code=201)
+
+    @app.get("/repos/{owner}/{name}/git/blobs/{sha}")
+    async def get_blob(owner: str, name: str, sha: str):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        data = repo["blobs"][sha]
+        return {"sha": sha, "size": len(data), "encoding": "base64", "content": base64.b64encode(data).decode(),
+                "url": f"{base_url}/repos/{owner}/{name}/git/blobs/{sha}"}
+
+    @app.post("/repos/{owner}/{name}/git/trees")
+    async def create_tree(owner: str, name: str, request: Request):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        body = await request.json()
+        entries = dict(repo["trees"][body["base_tree"]]) if body.get("base_tree") else {}
+        for element in body["tree"]:
+            if "content" in element:
+                entries[element["path"]] = put_blob(repo, element["content"].encode())
+            else:
+                entries[element["path"]] = element["sha"]
+        sha = put_tree(repo, entries)
+        return JSONResponse(tree_json(owner, name, sha, entries), status_code=201)
+
+    @app.get("/repos/{owner}/{name}/git/trees/{ref}")
+    async def get_tree(owner: str, name: str, ref: str):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        if ref in repo["trees"]:
+            sha = ref
+        else:
+            commit = repo["commits"].get(ref) or repo["commits"][repo["head"]]  # commit sha or branch name
+            sha = commit["tree"]
+        return tree_json(owner, name, sha, repo["trees"][sha])
+
+    def tree_json(owner, name, sha, entries):
+        repo = repos[name]
+        return {
+            "sha": sha, "url": f"{base_url}/repos/{owner}/{name}/git/trees/{sha}", "truncated": False,
+            "tree": [{"path": p, "mode": "100644", "type": "blob", "sha": s, "size": len(repo["blobs"][s]),
+                      "url": f"{base_url}/repos/{owner}/{name}/git/blobs/{s}"} for p, s in sorted(entries.items())],
+        }
+
+    @app.post("/repos/{owner}/{name}/pages")
+    async def enable_pages(owner: str, name: str, request: Request):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        repo["pages"] = (await request.json()).get("source")
+        start_build(repo)
+        return JSONResponse({"url": f"{base_url}/repos/{owner}/{name}/pages", "status": "queued",
+                             "html_url": f"https://{username}.github.io/{name}/"}, status_code=201)
+
+    @app.get("/repos/{owner}/{name}/pages")
+    async def get_pages(owner: str, name: str):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        if not repo["pages"]:
+            return JSONResponse({"message": "Not Found"}, status_code=404)
+        return {"status": "built", "html_url": f"https://{username}.github.io/{name}/"}
+
+    @app.get("/repos/{owner}/{name}/pages/builds/latest")
+    async def latest_build(owner: str, name: str):
+        repo, error = get_repo(name)
+        if error:
+            return error
+        if not repo["build"]:
+            return JSONResponse({"message": "Not Found"}, status_code=404)
+        commit, ready_at = repo["build"]
+        return {"status": "built" if time.time() >= ready_at else "building", "commit": commit,
+                "duration": int(build_time * 1000)}
+
+    app.state.repos = repos
+    return app
+
+
+def _route_name(path):
+    # Collapse ids so calls can be counted per endpoint
+    parts = path.strip("/").split("/")
+    if len(parts) >= 3 and parts[0] == "repos":
+        rest = parts[3:]
+        if rest[:1] == ["git"] and len(rest) >= 2:
+            return f"/repos/:repo/git/{rest[1]}"
+        return "/repos/:repo/" + (rest[0] if rest else "")
+    return path
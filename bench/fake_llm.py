@@ -0,0 +1,65 @@
+import asyncio
+import json
+import random
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def make_output(prompt, size):
+    """Deterministic fenced output with the usual four files, padded to ~`size` chars."""
+    tag = str(abs(hash(prompt)) % 10**6)
+    pad = max(0, size - 400) // 4
+    files = {
+        "index.html": f"<!DOCTYPE html>\n<html><head><link rel=\"stylesheet\" href=\"styles.css\"></head>\n"
+                      f"<body><h1 id=\"title\">App {tag}</h1><button id=\"btn\">Go</button>\n"
+                      f"<script src=\"script.js\"></script>\n<!-- {'x' * pad} -->\n</body></html>",
+        "styles.css": f"body {{ font-family: sans-serif; }}\n#btn {{ color: #333; }}\n/* {'y' * pad} */",
+        "script.js": f"document.getElementById('btn').onclick = () => alert('{tag}');\n// {'z' * pad}",
+        "README.md": f"# App {tag}\n\n## Project Overview\nGenerated for benchmarking.\n\n{'w' * pad}\n\n## License\nMIT",
+    }
+    return "\n\n".join(f"```{name}\n{code}\n```" for name, code in files.items())
+
+
+def create_app(latency=1.0, output_size=8000, chunks=50, stall_rate=0.0, fail_models=(), seed=0, model_latency=None):
+    """
+    Fake OpenAI-compatible chat completions endpoint.
+    Streams (SSE) when the request sets "stream": true, spreading `latency` across `chunks` deltas.
+    A `stall_rate` fraction of responses take 20x longer; models in `fail_models` answer 500.
+    `model_latency` ({model: seconds}) overrides `latency` per model.
+    """
+    app = FastAPI()
+    app.state.calls = Counter()
+    rng = random.Random(seed)
+
+    @app.post("/chat/completions")
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls[body.get("model", "?")] += 1
+        if body.get("model") in fail_models:
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+        prompt = json.dumps(body.get("messages", []))
+        text = make_output(prompt, output_size)
+        delay = (model_latency or {}).get(body.get("model"), latency) * (20 if rng.random() < stall_rate else 1)
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}}
+
+        async def events():
+            step = max(1, len(text) // chunks)
+            for i in range(0, len(text), step):
+                await asyncio.sleep(delay / chunks)
+                delta = {"choices": [{"index": 0, "delta": {"content": text[i:i + step]}}]}
+                yield f"data: {json.dumps(delta)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+                yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
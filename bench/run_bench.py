@@ -0,0 +1,290 @@
+"""
+Offline end-to-end benchmark for /api-endpoint.
+
+Starts local stand-ins for the LLM, GitHub and evaluation servers, launches
+`uvicorn main:app` against them and submits tasks at a fixed concurrency.
+
+    python bench/run_bench.py --tasks 50 --concurrency 10 --llm-latency 2 --round2
+
+Reports p50/p95/p99 latency (accept, job done, evaluator notified), throughput,
+API calls per task, server startup time and peak server RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import fake_eval  # noqa: E402
+import fake_github  # noqa: E402
+import fake_llm  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port):
+    """Runs an ASGI app with uvicorn in a daemon thread."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 3)}
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+async def run_task(client, app_url, eval_url, eval_state, payload, results):
+    started = time.monotonic()
+    response = await client.post(f"{app_url}/api-endpoint", json=payload)
+    accepted = time.monotonic()
+    record = {"nonce": payload["nonce"], "round": payload["round"], "status_code": response.status_code,
+              "accept": accepted - started}
+    if response.status_code != 202:
+        record["error"] = response.text
+        results.append(record)
+        return record
+
+    job_url = f"{app_url}{response.json()['status_url']}"
+    while True:
+        job = (await client.get(job_url)).json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+        await asyncio.sleep(0.05)
+    record["job"] = time.monotonic() - started
+    record["job_status"] = job["status"]
+    record["error"] = job.get("error")
+
+    # wait for the outbox to deliver the evaluation notification
+    key = (payload["nonce"], payload["round"])
+    deadline = time.monotonic() + 120
+    while job["status"] == "succeeded" and key not in eval_state.received and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if key in eval_state.received:
+        record["notified"] = eval_state.received[key] - started
+    results.append(record)
+    return record
+
+
+def make_payload(i, round_num, eval_url, run_id):
+    return {
+        "email": f"bench{i}@example.com",
+        "secret": SECRET,
+        "task": f"bench-{run_id}-{i}",
+        "round": round_num,
+        "nonce": f"nonce-{run_id}-{i}",
+        "brief": f"Build app {i}" if round_num == 1 else f"Change the button color of app {i} to blue",
+        "checks": ["Page has a #btn button"],
+        "evaluation_url": eval_url,
+        "attachments": [],
+    }
+
+
+async def main(args):
+    ports = {name: free_port() for name in ("llm", "github", "eval", "app")}
+    github_url = f"http://127.0.0.1:{ports['github']}"
+    eval_url = f"http://127.0.0.1:{ports['eval']}/notify"
+    app_url = f"http://127.0.0.1:{ports['app']}"
+
+    llm_app = fake_llm.create_app(args.llm_latency, args.llm_output_chars, args.llm_chunks,
+                                  stall_rate=args.llm_stall_rate, fail_models=args.llm_fail_models,
+                                  model_latency=args.llm_model_latency)
+    github_app = fake_github.create_app(github_url, rate_limit=args.github_rate_limit, latency=args.github_latency,
+                                        rate_window=args.github_rate_window, build_time=args.pages_build_time)
+    eval_app = fake_eval.create_app(args.eval_failure_rate)
+    servers = [
+        serve(llm_app, ports["llm"]),
+        serve(github_app, ports["github"]),
+        serve(eval_app, ports["eval"]),
+    ]
+
+    workdir = Path(tempfile.mkdtemp(prefix="tds-bench-"))
+    env = dict(
+        os.environ,
+        MY_SECRET=SECRET, API_KEY="bench", GITHUB_TOKEN="bench", GITHUB_USERNAME="bench-user",
+        LLM_API_URL=f"http://127.0.0.1:{ports['llm']}/chat/completions", GITHUB_API_URL=github_url,
+        STATE_DB=str(workdir / "state.db"), LLM_CACHE_DB=str(workdir / "llm_cache.db"),
+        SNAPSHOT_CACHE_DIR=str(workdir / "snapshots"), OUTBOX_BASE_DELAY="0.2", OUTBOX_POLL_INTERVAL="0.1",
+        PAGES_POLL_INTERVAL="0.5", ROUTING_LOG=str(workdir / "routing.jsonl"),
+    )
+    env.update(args.env)  # --env may override any of the above
+    launched = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(ports["app"]), "--log-level", "warning"]
+        + (["--workers", str(args.workers)] if args.workers > 1 else []),
+        cwd=ROOT, env=env, stdout=None if args.verbose else subprocess.DEVNULL,
+    )
+
+    peak_rss = 0.0
+    sampling = True
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while sampling:
+            peak_rss = max(peak_rss, rss_mb(server.pid) or 0.0)
+            await asyncio.sleep(0.1)
+
+    try:
+        await wait_ready(app_url + "/")
+        startup = time.monotonic() - launched
+        baseline_rss = round(rss_mb(server.pid) or 0.0, 1)
+        sampler = asyncio.create_task(sample_memory())
+        run_id = str(int(time.time()))
+        semaphore = asyncio.Semaphore(args.concurrency)
+        results = []
+
+        async def one(i):
+            async with semaphore:
+                record = await run_task(client, app_url, eval_url, eval_app.state,
+                                        make_payload(i, 1, eval_url, run_id), results)
+            if args.round2 and record.get("job_status") == "succeeded":
+                async with semaphore:
+                    await run_task(client, app_url, eval_url, eval_app.state,
+                                   make_payload(i, 2, eval_url, run_id), results)
+
+        started = time.monotonic()
+        async with httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+            await asyncio.gather(*(one(i) for i in range(args.tasks)))
+        elapsed = time.monotonic() - started
+        sampling = False
+        await sampler
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        for s in servers:
+            s.should_exit = True
+
+    succeeded = [r for r in results if r.get("job_status") == "succeeded"]
+    github_calls = sum(github_app.state.calls.values())
+    report = {
+        "tasks": len(results),
+        "succeeded": len(succeeded),
+        "failed": [{"nonce": r["nonce"], "round": r["round"], "error": r.get("error")} for r in results
+                   if r.get("job_status") != "succeeded"][:10],
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_tasks_per_s": round(len(succeeded) / elapsed, 3) if elapsed else None,
+        "latency_s": {
+            "accept": percentiles([r["accept"] for r in results]),
+            "job_done": percentiles([r["job"] for r in results if "job" in r]),
+            "notified": percentiles([r["notified"] for r in results if "notified" in r]),
+        },
+        "round2_job_done_s": percentiles([r["job"] for r in results if r["round"] == 2 and "job" in r]),
+        "llm_calls_by_model": dict(llm_app.state.calls),
+        "api_calls_per_task": {
+            "github": round(github_calls / max(1, len(results)), 2),
+            "llm": round(sum(llm_app.state.calls.values()) / max(1, len(results)), 2),
+            "eval_attempts": round(eval_app.state.attempts / max(1, len(results)), 2),
+        },
+        "github_calls_by_endpoint": dict(github_app.state.calls.most_common()),
+        "github_rate_limited": github_app.state.rate_limited,
+        "startup_s": round(startup, 3),
+        "memory_mb": {"baseline_rss": baseline_rss, "peak_rss": round(peak_rss, 1)},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return report
+
+
+def print_report(report):
+    print(f"\n📊 {report['succeeded']}/{report['tasks']} tasks succeeded in {report['elapsed_s']}s "
+          f"(concurrency {report['concurrency']}, {report['throughput_tasks_per_s']} tasks/s)")
+    for name, stats in report["latency_s"].items():
+        print(f"   {name:<9} p50={stats['p50']}s p95={stats['p95']}s p99={stats['p99']}s max={stats['max']}s")
+    if report["round2_job_done_s"]["p50"] is not None:
+        r2 = report["round2_job_done_s"]
+        print(f"   round 2   p50={r2['p50']}s p95={r2['p95']}s p99={r2['p99']}s")
+    calls = report["api_calls_per_task"]
+    print(f"   calls/task: github={calls['github']} llm={calls['llm']} eval={calls['eval_attempts']} "
+          f"(github rate limited {report['github_rate_limited']}x)")
+    print("   llm calls: " + ", ".join(f"{m}={n}" for m, n in report["llm_calls_by_model"].items()))
+    for endpoint, count in report["github_calls_by_endpoint"].items():
+        print(f"      {count:>6}  {endpoint}")
+    print(f"   startup: {report['startup_s']}s from launch to first 200 on /")
+    print(f"   memory: baseline {report['memory_mb']['baseline_rss']} MB, peak {report['memory_mb']['peak_rss']} MB")
+    for failure in report["failed"]:
+        print(f"   ❌ {failure['nonce']} round {failure['round']}: {failure['error']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the /api-endpoint pipeline")
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--round2", action="store_true", help="send a round-2 update after each round 1")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per LLM response")
+    parser.add_argument("--llm-output-chars", type=int, default=8000)
+    parser.add_argument("--llm-chunks", type=int, default=50, help="SSE deltas per streamed response")
+    parser.add_argument("--llm-stall-rate", type=float, default=0.0, help="fraction of LLM responses 20x slower")
+    parser.add_argument("--llm-fail-models", default="", help="comma-separated models that always fail")
+    parser.add_argument("--llm-model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="per-model LLM latency (e.g. a faster routed model)")
+    parser.add_argument("--github-latency", type=float, default=0.0, help="seconds added to every GitHub call")
+    parser.add_argument("--github-rate-limit", type=int, default=5000)
+    parser.add_argument("--github-rate-window", type=int, default=3600, help="seconds until the quota refills")
+    parser.add_argument("--pages-build-time", type=float, default=0.0, help="seconds per Pages build")
+    parser.add_argument("--eval-failure-rate", type=float, default=0.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the server (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show server output")
+    args = parser.parse_args(argv)
+    args.env = dict(item.split("=", 1) for item in args.env)
+    args.llm_fail_models = [m for m in args.llm_fail_models.split(",") if m]
+    args.llm_model_latency = {m: float(t) for m, _, t in (e.rpartition("=") for e in args.llm_model_latency)}
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
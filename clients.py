@@ -0,0 +1,288 @@
+import asyncio
+import os
+import re
+import threading
+import time
+
+import metrics
+
+# App-lifetime HTTP / GitHub clients and the rate limiters every outbound call goes through
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_POOL_SIZE = int(os.getenv("GITHUB_POOL_SIZE", "32"))
+GITHUB_TIMEOUT = int(os.getenv("GITHUB_TIMEOUT", "30"))
+GITHUB_REQUESTS_PER_HOUR = float(os.getenv("GITHUB_REQUESTS_PER_HOUR", "5000"))
+GITHUB_BURST = int(os.getenv("GITHUB_BURST", "1000"))
+GITHUB_WRITES_PER_MINUTE = float(os.getenv("GITHUB_WRITES_PER_MINUTE", "80"))
+GITHUB_WRITE_BURST = int(os.getenv("GITHUB_WRITE_BURST", "20"))
+GITHUB_SECONDARY_WAIT = float(os.getenv("GITHUB_SECONDARY_WAIT", "60"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "300"))
+LLM_BURST = int(os.getenv("LLM_BURST", "20"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "3"))
+
+# GitHub calls that create content (counted against the secondary rate limit)
+WRITE_OPS = {"create_repo", "create_blob", "create_tree", "create_commit", "update_ref", "enable_pages"}
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all callers of one API. Calls wait for a token
+    instead of failing; the refill rate follows the quota the API reports.
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # take a token now (the balance may go negative) and return how long to wait for it
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = max(self._paused_until - now, -self._tokens / self.rate if self._tokens < 0 else 0.0)
+        if wait > 0:
+            metrics.observe("tds_rate_limit_wait_seconds", wait, api=self.name)
+        return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update(self, remaining, reset_in):
+        """Spreads the `remaining` quota over the `reset_in` seconds left in the window."""
+        if remaining is None or reset_in is None:
+            return
+        with self._lock:
+            if remaining <= 0:
+                self._paused_until = max(self._paused_until, time.monotonic() + reset_in)
+            else:
+                self.rate = remaining / max(1.0, reset_in)
+                self._tokens = min(self._tokens, remaining)
+
+    def pause(self, seconds):
+        """Holds every caller back for `seconds` (after a 403/429 rate limit response)."""
+        metrics.inc("tds_rate_limited_total", api=self.name)
+        print(f"⏳ {self.name} rate limited, pausing calls for {seconds:.1f}s")
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+github_limiter = RateLimiter("github", GITHUB_REQUESTS_PER_HOUR / 3600, GITHUB_BURST)
+github_write_limiter = RateLimiter("github_writes", GITHUB_WRITES_PER_MINUTE / 60, GITHUB_WRITE_BURST)
+llm_limiter = RateLimiter("llm", LLM_REQUESTS_PER_MINUTE / 60, LLM_BURST)
+
+_github = None
+_github_lock = threading.Lock()
+_http = None
+_async_http = None
+_warmup = None
+
+
+def get_github():
+    """
+    Returns the shared PyGithub client (created on first use).
+    PyGithub's own fixed sleeps between requests are off; pacing is done by the limiters.
+    """
+    global _github
+    with _github_lock:
+        if _github is None:
+            # imported on first use: PyGithub (with requests and jwt) is the slowest import at cold start
+            from github import Github, GithubRetry
+
+            _github = Github(
+                GITHUB_TOKEN,
+                base_url=GITHUB_API_URL,
+                timeout=GITHUB_TIMEOUT,
+                pool_size=GITHUB_POOL_SIZE,
+                seconds_between_requests=None,
+                seconds_between_writes=None,
+                # rate limit responses raise so github_call can pause every thread, not just this one
+                retry=GithubRetry(total=5, max_rate_limit_wait=0),
+            )
+    return _github
+
+
+def http():
+    """Shared keep-alive httpx.Client for blocking code running in worker threads."""
+    global _http
+    if _http is None:
+        import httpx  # imported on first use (or by the startup warm-up), like PyGithub
+
+        _http = httpx.Client(timeout=GITHUB_TIMEOUT, limits=_limits())
+    return _http
+
+
+def async_http():
+    """Shared keep-alive httpx.AsyncClient for the LLM provider and evaluation servers."""
+    global _async_http
+    if _async_http is None:
+        import httpx
+
+        _async_http = httpx.AsyncClient(timeout=600, limits=_limits())
+    return _async_http
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+def _warm():
+    import httpx  # noqa: F401
+
+    get_github()
+
+
+async def start():
+    global _warmup
+    # httpx and the PyGithub client are loaded in the background so importing them does not delay readiness
+    _warmup = asyncio.create_task(asyncio.to_thread(_warm))
+
+
+async def stop():
+    global _http, _async_http, _github
+    if _warmup is not None:
+        await asyncio.gather(_warmup, return_exceptions=True)
+    if _async_http is not None:
+        await _async_http.aclose()
+        _async_http = None
+    if _http is not None:
+        _http.close()
+        _http = None
+    if _github is not None:
+        _github.close()
+        _github = None
+
+
+def github_call(op, fn, *args, **kwargs):
+    """
+    Runs one GitHub call through the rate limiters, counting it (and any error) in the metrics.
+    Rate limit errors pause all GitHub calls until the quota resets, then the call is retried.
+    """
+    import httpx
+    from github.GithubException import RateLimitExceededException
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        github_limiter.acquire()
+        if op in WRITE_OPS:
+            github_write_limiter.acquire()
+        try:
+            with metrics.external_call("github", op):
+                result = fn(*args, **kwargs)
+        except RateLimitExceededException as e:
+            if attempt == RATE_LIMIT_RETRIES:
+                raise
+            github_limiter.pause(_github_backoff(e.headers or {}))
+            continue
+        if isinstance(result, httpx.Response):
+            observe_github_headers(result.headers)
+            if _is_rate_limited(result) and attempt < RATE_LIMIT_RETRIES:
+                github_limiter.pause(_github_backoff(result.headers))
+                continue
+        else:
+            requester = get_github().requester
+            remaining, _ = requester.rate_limiting
+            if remaining >= 0 and requester.rate_limiting_resettime:
+                github_limiter.update(remaining, requester.rate_limiting_resettime - time.time())
+        return result
+
+
+def github_headers():
+    return {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
+
+
+async def github_async(op, method, url, **kwargs):
+    """Async counterpart of github_call for plain REST requests on the pooled AsyncClient."""
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        await github_limiter.acquire_async()
+        if op in WRITE_OPS:
+            await github_write_limiter.acquire_async()
+        with metrics.external_call("github", op):
+            response = await async_http().request(
+                method, url, headers=github_headers(), timeout=GITHUB_TIMEOUT, **kwargs
+            )
+        observe_github_headers(response.headers)
+        if _is_rate_limited(response) and attempt < RATE_LIMIT_RETRIES:
+            github_limiter.pause(_github_backoff(response.headers))
+            continue
+        return response
+
+
+def observe_github_headers(headers):
+    remaining = headers.get("x-ratelimit-remaining")
+    reset = headers.get("x-ratelimit-reset")
+    if remaining and reset:
+        github_limiter.update(int(remaining), float(reset) - time.time())
+
+
+def _is_rate_limited(response):
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and (
+        "retry-after" in response.headers or response.headers.get("x-ratelimit-remaining") == "0"
+    )
+
+
+def _github_backoff(headers):
+    headers = {k.lower(): v for k, v in headers.items()}
+    if headers.get("retry-after"):
+        return float(headers["retry-after"])
+    if headers.get("x-ratelimit-remaining") == "0" and headers.get("x-ratelimit-reset"):
+        return max(1.0, float(headers["x-ratelimit-reset"]) - time.time() + 1)
+    return GITHUB_SECONDARY_WAIT  # secondary limit without a hint
+
+
+def _parse_duration(value):
+    # OpenAI-style reset values: "20ms", "1s", "6m0s", "1h2m3.5s"
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    return sum(float(n) * units[u] for n, u in parts) if parts else None
+
+
+def observe_llm_headers(headers):
+    remaining = headers.get("x-ratelimit-remaining-requests")
+    if remaining is not None and remaining.isdigit():
+        llm_limiter.update(int(remaining), _parse_duration(headers.get("x-ratelimit-reset-requests")))
+
+
+async def llm_call(fn):
+    """
+    Awaits `fn()` (one LLM request) through the LLM limiter.
+    429 responses pause all LLM calls for Retry-After seconds and the request is retried.
+    """
+    import httpx
+
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        await llm_limiter.acquire_async()
+        try:
+            return await fn()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+                raise
+            llm_limiter.pause(_parse_duration(e.response.headers.get("retry-after")) or 2.0 ** attempt)
+
+
+metrics.describe("tds_rate_limit_wait_seconds", "histogram", "Time calls waited for a rate limiter token")
+metrics.describe("tds_rate_limited_total", "counter", "Rate limit responses that paused an API")
@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli
+except ImportError:  # optional dependency, gzip only
+    brotli = None
+
+# The home page, compressed once at startup and revalidated by ETag
+HOME_PAGE = os.getenv("HOME_PAGE", "index.html")
+HOME_MAX_AGE = int(os.getenv("HOME_MAX_AGE", "300"))
+
+
+class Page:
+    """
+    A static page held in memory in every encoding we serve (identity, gzip and,
+    with the `brotli` package, br), each with its own strong ETag.
+    """
+
+    def __init__(self, body, media_type="text/html; charset=utf-8", max_age=HOME_MAX_AGE):
+        self.media_type = media_type
+        self.max_age = max_age
+        self.tag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+
+    @classmethod
+    def load(cls, path=HOME_PAGE, **kwargs):
+        with open(path, "rb") as f:
+            return cls(f.read(), **kwargs)
+
+    def etag(self, encoding):
+        return f'"{self.tag}"' if encoding == "identity" else f'"{self.tag}-{encoding}"'
+
+    def negotiate(self, accept_encoding):
+        """Picks br, then gzip, then identity among the encodings the client accepts (q > 0)."""
+        accepted = {}
+        for part in (accept_encoding or "").split(","):
+            coding, _, params = part.strip().partition(";")
+            q = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            if coding:
+                accepted[coding.strip().lower()] = q
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return "identity"
+
+    def not_modified(self, if_none_match):
+        """True if If-None-Match names this page's content in any encoding (or is *)."""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/").strip('"')
+            if tag == "*" or tag.split("-")[0] == self.tag:
+                return True
+        return False
+
+    def respond(self, headers):
+        """(status, body, response headers) for a GET with the given request headers."""
+        encoding = self.negotiate(headers.get("accept-encoding"))
+        response_headers = {
+            "ETag": self.etag(encoding),
+            "Cache-Control": f"public, max-age={self.max_age}",
+            "Vary": "Accept-Encoding",
+        }
+        if self.not_modified(headers.get("if-none-match")):
+            return 304, b"", response_headers
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return 200, self.variants[encoding], response_headers
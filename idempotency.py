@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Task executions keyed by (nonce, round, brief, checks), shared by every worker process
+STATE_DB = os.getenv("STATE_DB", "state.db")
+# a 'running' claim whose owning process has not heartbeated for this long is abandoned
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "60"))
+
+OWNER = f"{os.getpid()}:{uuid.uuid4().hex}"  # this process
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(STATE_DB, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS task_runs (
+                key TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                nonce TEXT,
+                round INTEGER,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS task_runs_job ON task_runs(job_id);
+            CREATE INDEX IF NOT EXISTS task_runs_nonce ON task_runs(nonce, round);
+        """)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(task_runs)")}
+        if "owner" not in columns:  # tables created before claims had owners
+            conn.execute("ALTER TABLE task_runs ADD COLUMN owner TEXT")
+            conn.execute("ALTER TABLE task_runs ADD COLUMN heartbeat_at REAL")
+        _conn = conn
+    return _conn
+
+
+def task_key(data):
+    """Hash of the fields that make two submissions the same task."""
+    identity = {k: data.get(k) for k in ("nonce", "round", "brief", "checks")}
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _row(row):
+    if row is None:
+        return None
+    record = dict(row)
+    record["result"] = json.loads(record["result"]) if record["result"] else None
+    if record["status"] == "running" and (record["heartbeat_at"] or 0) < time.time() - IDEMPOTENCY_TTL:
+        record["status"] = "abandoned"  # its process died before finishing it
+    return record
+
+
+def claim(key, job_id, nonce=None, round_num=None):
+    """
+    Registers `job_id` (run by this process) as the execution of `key`. Returns None if the
+    claim was taken, otherwise the existing record (running or succeeded).
+    Failed runs, and running ones whose process stopped heartbeating, are re-claimed.
+    """
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        cur = conn.execute(
+            "INSERT INTO task_runs (key, job_id, nonce, round, status, owner, created_at, updated_at, heartbeat_at) "
+            "VALUES (?, ?, ?, ?, 'running', ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET job_id = excluded.job_id, status = 'running', result = NULL, "
+            "error = NULL, owner = excluded.owner, updated_at = excluded.updated_at, "
+            "heartbeat_at = excluded.heartbeat_at "
+            "WHERE task_runs.status = 'failed' "
+            "OR (task_runs.status = 'running' AND COALESCE(task_runs.heartbeat_at, 0) < ?)",
+            (key, job_id, nonce, round_num, OWNER, now, now, now, now - IDEMPOTENCY_TTL),
+        )
+        if cur.rowcount == 1:
+            return None
+        return _row(conn.execute("SELECT * FROM task_runs WHERE key = ?", (key,)).fetchone())
+
+
+def finish(key, job_id, result=None, error=None):
+    with _lock:
+        _connect().execute(
+            "UPDATE task_runs SET status = ?, result = ?, error = ?, updated_at = ? WHERE key = ? AND job_id = ?",
+            ("failed" if error else "succeeded", json.dumps(result) if result is not None else None,
+             error, time.time(), key, job_id),
+        )
+
+
+def forget(key, job_id):
+    """Drops a claim whose job never got queued."""
+    with _lock:
+        _connect().execute("DELETE FROM task_runs WHERE key = ? AND job_id = ?", (key, job_id))
+
+
+def heartbeat():
+    """Marks every running claim of this process as still alive."""
+    with _lock:
+        _connect().execute(
+            "UPDATE task_runs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'", (time.time(), OWNER)
+        )
+
+
+async def keep_alive():
+    """Heartbeats this process's claims every IDEMPOTENCY_TTL/3 seconds until cancelled."""
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_TTL / 3)
+        try:
+            await asyncio.to_thread(heartbeat)
+        except sqlite3.Error as e:
+            print(f"⚠️ Claim heartbeat failed: {e}")
+
+
+def earlier_round_running(nonce, round_num):
+    """True if a round of `nonce` before `round_num` is queued or running in a live process."""
+    with _lock:
+        row = _connect().execute(
+            "SELECT 1 FROM task_runs WHERE nonce = ? AND round < ? AND status = 'running' "
+            "AND COALESCE(heartbeat_at, 0) >= ? LIMIT 1",
+            (nonce, round_num, time.time() - IDEMPOTENCY_TTL),
+        ).fetchone()
+    return row is not None
+
+
+def get(key):
+    with _lock:
+        return _row(_connect().execute("SELECT * FROM task_runs WHERE key = ?", (key,)).fetchone())
+
+
+def get_by_job(job_id):
+    with _lock:
+        return _row(_connect().execute("SELECT * FROM task_runs WHERE job_id = ?", (job_id,)).fetchone())
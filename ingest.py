@@ -0,0 +1,329 @@
+import codecs
+import json
+import os
+import re
+
+import attachments as attachments_mod
+
+# Bounded request ingestion: task bodies are parsed as they arrive instead of
+# being buffered whole, and attachment data is spooled straight to the store
+REQUEST_MAX_BYTES = int(os.getenv("REQUEST_MAX_BYTES", str(50 * 1024 * 1024)))
+FIELD_MAX_BYTES = int(os.getenv("FIELD_MAX_BYTES", str(1024 * 1024)))  # any value besides attachment data
+ATTACHMENT_MAX_COUNT = int(os.getenv("ATTACHMENT_MAX_COUNT", "20"))
+
+# Accepted types per task field (other fields are kept as they are) and the fields a task needs
+SCHEMA = {
+    "email": str, "secret": str, "task": str, "round": int, "nonce": str, "brief": str,
+    "checks": list, "evaluation_url": str, "attachments": list, "no_cache": bool,
+}
+REQUIRED = ("secret", "task", "round", "nonce", "brief")
+
+_WS = b" \t\r\n"
+_STRING_STOP = re.compile(rb'["\\]')
+# a \uXXXX escape, or a high + low surrogate pair decoded together into one character
+_ESCAPE = re.compile(
+    rb'\\(?:u(?:[dD][89abAB][0-9a-fA-F]{2}\\u[dD][c-fC-F][0-9a-fA-F]{2}|[0-9a-fA-F]{4})|["\\/bfnrt])'
+)
+
+
+class Rejected(Exception):
+    """A request refused during ingestion; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = {403: "invalid_secret", 413: "too_large"}.get(status, "invalid")  # tds_requests_total
+
+
+class _Reader:
+    """Reads a JSON body from an async iterator of byte chunks, holding at most about one chunk."""
+
+    def __init__(self, chunks, limit):
+        self._chunks = chunks.__aiter__()
+        self._buf = b""
+        self._pos = 0
+        self._limit = limit
+        self.total = 0
+
+    async def _fill(self):
+        """Appends the next chunk to the unread bytes; returns False at the end of the body."""
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return False
+        self.total += len(chunk)
+        if self.total > self._limit:
+            raise Rejected(413, f"Request body exceeds {self._limit} bytes")
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    async def peek(self):
+        """The next non-whitespace byte, without consuming it (b"" at the end of the body)."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WS:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos:self._pos + 1]
+            if not await self._fill():
+                return b""
+
+    async def take(self, allowed):
+        token = await self.peek()
+        if not token:
+            raise Rejected(400, "Invalid JSON: unexpected end of body")
+        if token not in allowed:
+            raise Rejected(400, f"Invalid JSON: unexpected {token.decode(errors='replace')!r}")
+        self._pos += 1
+        return token
+
+    async def value(self, limit=FIELD_MAX_BYTES):
+        """Parses the next JSON value of any type, refusing values over `limit` bytes."""
+        await self.peek()
+        raw = bytearray()
+        depth, in_string, escaped = 0, False, False
+        while True:
+            buf, i, end = self._buf, self._pos, None
+            while i < len(buf):
+                if in_string:
+                    if escaped:
+                        escaped = False
+                        i += 1
+                        continue
+                    match = _STRING_STOP.search(buf, i)
+                    if match is None:
+                        i = len(buf)
+                        break
+                    i = match.start() + 1
+                    if buf[i - 1] == 0x5C:  # backslash
+                        escaped = True
+                    else:
+                        in_string = False
+                        if depth == 0:
+                            end = i
+                            break
+                    continue
+                c = buf[i]
+                if c == 0x22:  # quote
+                    in_string = True
+                elif c in b"[{":
+                    depth += 1
+                elif c in b"]}":
+                    if depth == 0:
+                        end = i
+                        break
+                    depth -= 1
+                    if depth == 0:
+                        end = i + 1
+                        break
+                elif depth == 0 and (c in b"," or c in _WS):
+                    end = i
+                    break
+                i += 1
+            stop = len(buf) if end is None else end
+            raw += buf[self._pos:stop]
+            self._pos = stop
+            if len(raw) > limit:
+                raise Rejected(413, f"A field exceeds {limit} bytes")
+            if end is not None:
+                break
+            if not await self._fill():
+                raise Rejected(400, "Invalid JSON: unexpected end of body")
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            raise Rejected(400, f"Invalid JSON: {e}")
+
+    async def string(self, sink):
+        """Feeds the next JSON string to sink(text) piece by piece as it arrives."""
+        await self.take(b'"')
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        while True:
+            match = _STRING_STOP.search(self._buf, self._pos)
+            if match is None:
+                if self._pos < len(self._buf):
+                    sink(decoder.decode(self._buf[self._pos:]))
+                    self._pos = len(self._buf)
+                if not await self._fill():
+                    raise Rejected(400, "Invalid JSON: unterminated string")
+                continue
+            if match.start() > self._pos:
+                sink(decoder.decode(self._buf[self._pos:match.start()]))
+            self._pos = match.start()
+            if self._buf[self._pos] == 0x22:  # closing quote
+                self._pos += 1
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    sink(tail)
+                return
+            while len(self._buf) - self._pos < 12 and await self._fill():
+                pass
+            escape = _ESCAPE.match(self._buf, self._pos)
+            if escape is None:
+                raise Rejected(400, "Invalid JSON: bad escape in string")
+            sink(json.loads(b'"' + escape.group() + b'"'))
+            self._pos = escape.end()
+
+
+def _check(field, value):
+    expected = SCHEMA.get(field)
+    if expected is None:
+        return
+    if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+        raise Rejected(400, f"Field '{field}' must be of type {expected.__name__}")
+
+
+def _check_attachment_keys(keys):
+    reserved = [key for key in keys if key in attachments_mod.REFERENCE_KEYS]
+    if reserved:
+        raise Rejected(400, f"Attachment field(s) {', '.join(reserved)} are set by the server")
+
+
+def validate(data, secret):
+    """
+    Applies read_task's checks to a payload that is already parsed (e.g. one line of a batch):
+    secret, field types, required fields and attachment count. Raises Rejected.
+    """
+    if data.get("secret") != secret:
+        raise Rejected(403, "Invalid secret")
+    for field, value in data.items():
+        _check(field, value)
+    attachments = data.get("attachments") or []
+    if len(attachments) > ATTACHMENT_MAX_COUNT:
+        raise Rejected(413, f"More than {ATTACHMENT_MAX_COUNT} attachments")
+    for attachment in attachments:
+        if not isinstance(attachment, dict):
+            raise Rejected(400, "Each attachment must be an object")
+        if not isinstance(attachment.get("name", ""), str):
+            raise Rejected(400, "Attachment 'name' must be of type str")
+        _check_attachment_keys(attachment)
+    missing = [field for field in REQUIRED if field not in data]
+    if missing:
+        raise Rejected(400, f"Missing field(s): {', '.join(missing)}")
+
+
+class _UrlSink:
+    """Collects an attachment's url; once it is known to be a data: URI, spools it to disk instead."""
+
+    def __init__(self):
+        self.text = ""
+        self.spool = None
+
+    def __call__(self, piece):
+        if self.spool is not None:
+            self.spool.feed(piece)
+            return
+        self.text += piece
+        if len(self.text) >= 5 and self.text.startswith("data:"):
+            self.spool = attachments_mod.Spool()
+            self.spool.feed(self.text)
+            self.text = ""
+        elif len(self.text) > FIELD_MAX_BYTES:
+            raise Rejected(413, f"An attachment url exceeds {FIELD_MAX_BYTES} bytes")
+
+
+async def _attachment(reader, spools):
+    await reader.take(b"{")
+    attachment = {}
+    if await reader.peek() == b"}":
+        await reader.take(b"}")
+        return attachment
+    while True:
+        key = await reader.value()
+        if not isinstance(key, str):
+            raise Rejected(400, "Invalid JSON: object keys must be strings")
+        _check_attachment_keys([key])
+        await reader.take(b":")
+        if key == "url" and await reader.peek() == b'"':
+            sink = _UrlSink()
+            try:
+                await reader.string(sink)
+            except attachments_mod.AttachmentTooLarge as e:
+                raise Rejected(413, f"Attachment {attachment.get('name')!r}: {e}")
+            except ValueError as e:  # bad base64 or data: header
+                raise Rejected(400, f"Attachment {attachment.get('name')!r} is not a valid data: URI ({e})")
+            finally:
+                if sink.spool is not None:
+                    spools.append((attachment, sink.spool))
+            attachment["url"] = sink.text
+        else:
+            attachment[key] = await reader.value()
+            if key == "name" and not isinstance(attachment[key], str):
+                raise Rejected(400, "Attachment 'name' must be of type str")
+        if await reader.take(b",}") == b"}":
+            return attachment
+
+
+async def _attachments(reader, spools):
+    if await reader.peek() != b"[":
+        raise Rejected(400, "Field 'attachments' must be of type list")
+    await reader.take(b"[")
+    items = []
+    if await reader.peek() == b"]":
+        await reader.take(b"]")
+        return items
+    while True:
+        if len(items) == ATTACHMENT_MAX_COUNT:
+            raise Rejected(413, f"More than {ATTACHMENT_MAX_COUNT} attachments")
+        if await reader.peek() != b"{":
+            raise Rejected(400, "Each attachment must be an object")
+        items.append(await _attachment(reader, spools))
+        if await reader.take(b",]") == b"]":
+            return items
+
+
+async def read_task(chunks, secret, content_length=None, limit=REQUEST_MAX_BYTES):
+    """
+    Parses one task payload from the body's byte chunks without buffering it whole.
+    The secret and each field's type are checked as soon as they arrive, so a bad request
+    is refused without reading the rest; data: URI attachments are decoded straight into
+    the attachment store and come back as references. Raises Rejected.
+    """
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise Rejected(413, f"Request body exceeds {limit} bytes")
+    reader = _Reader(chunks, limit)
+    data, spools = {}, []
+    try:
+        await reader.take(b"{")
+        if await reader.peek() == b"}":
+            await reader.take(b"}")
+        else:
+            while True:
+                key = await reader.value()
+                if not isinstance(key, str):
+                    raise Rejected(400, "Invalid JSON: object keys must be strings")
+                if key in data:
+                    raise Rejected(400, f"Duplicate field '{key}'")
+                await reader.take(b":")
+                if key == "attachments":
+                    data[key] = await _attachments(reader, spools)
+                else:
+                    data[key] = await reader.value()
+                    _check(key, data[key])
+                    if key == "secret" and data[key] != secret:
+                        raise Rejected(403, "Invalid secret")
+                if await reader.take(b",}") == b"}":
+                    break
+        if await reader.peek():
+            raise Rejected(400, "Invalid JSON: data after the payload")
+
+        validate(data, secret)
+        if spools:
+            refs = {id(attachment): spool.commit(attachment.get("name")) for attachment, spool in spools}
+            data["attachments"] = [refs.get(id(attachment), attachment) for attachment in data["attachments"]]
+        return data
+    finally:
+        for _, spool in spools:
+            spool.discard()
+
+
+async def read_body(chunks, content_length=None, limit=REQUEST_MAX_BYTES):
+    """Reads a whole body (e.g. a batch), refusing it once it grows past `limit` bytes."""
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise Rejected(413, f"Request body exceeds {limit} bytes")
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > limit:
+            raise Rejected(413, f"Request body exceeds {limit} bytes")
+    return bytes(body)
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+import metrics
+
+# Worker pool sizing (tune for burst submission windows)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "1000"))
+
+
+class Deferred(Exception):
+    """Raised by a handler to run the job again after `delay` seconds without holding a worker meanwhile."""
+
+    def __init__(self, delay, stage="deferred"):
+        super().__init__(f"deferred for {delay:.1f}s")
+        self.delay = delay
+        self.stage = stage
+
+
+class Job:
+    """
+    A single queued task: tracks its status, the stage it is in,
+    how long each stage took and the final result or error.
+    """
+
+    def __init__(self, payload, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.stage = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.metrics = {}
+        self.result = None
+        self.error = None
+        self._stage_started = None
+        self._done = asyncio.Event()
+
+    def set_stage(self, stage, error=None):
+        """Closes the timing of the current stage and starts a new one."""
+        now = time.monotonic()
+        if self._stage_started is not None:
+            duration = now - self._stage_started
+            self.timings[self.stage] = round(duration, 3)
+            metrics.record_span(self.stage, duration, error)
+        self.stage = stage
+        self._stage_started = now
+        print(f"⏱️ Job {self.id}: {stage}")
+
+    def finish(self, result=None, error=None):
+        self.set_stage("failed" if error else "done", error="JobFailed" if error else None)
+        self._stage_started = None
+        self.finished_at = time.time()
+        self.result = result
+        self.error = error
+        self.status = "failed" if error else "succeeded"
+        self._done.set()
+
+    async def wait(self):
+        """Waits until the job has succeeded or failed."""
+        await self._done.wait()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "task": self.payload.get("task"),
+            "nonce": self.payload.get("nonce"),
+            "round": self.payload.get("round"),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": self.timings,
+            "metrics": self.metrics,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Bounded queue of jobs served by a fixed pool of asyncio workers.
+    `handler(payload, job)` does the actual work and returns the result dict;
+    `on_drop(job)` is called for each job still queued (or deferred) when the pool stops.
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, maxsize=JOB_QUEUE_SIZE, history=JOB_HISTORY, on_drop=None):
+        self.handler = handler
+        self.on_drop = on_drop
+        self.workers = workers
+        self.maxsize = maxsize
+        self.history = history
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+        self._deferred = {}  # requeue task -> job
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"👷 Started {self.workers} job worker(s), queue size {self.maxsize}")
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        dropped = [job for task, job in self._deferred.items() if not task.done()]
+        for task in self._deferred:
+            task.cancel()
+        await asyncio.gather(*self._deferred, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            dropped.append(self._queue.get_nowait())
+        for job in dropped:
+            job.finish(error="Server stopped before the job started")
+            metrics.inc("tds_jobs_total", status="dropped")
+            if self.on_drop:
+                await self.on_drop(job)
+
+    def submit(self, payload, job_id=None):
+        """
+        Enqueues a payload and returns its Job.
+        Raises asyncio.QueueFull when the queue is at capacity.
+        """
+        job = Job(payload, job_id)
+        self._queue.put_nowait(job)
+        self.jobs[job.id] = job
+        self._trim()
+        return job
+
+    async def put(self, payload, job_id=None):
+        """Like submit(), but waits for room in the queue instead of raising."""
+        job = Job(payload, job_id)
+        await self._queue.put(job)
+        self.jobs[job.id] = job
+        self._trim()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def _defer(self, job, delay, stage):
+        job.status = "queued"
+        job.set_stage(stage)
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self._queue.put(job)
+
+        task = asyncio.create_task(requeue())
+        self._deferred[task] = job
+        task.add_done_callback(lambda t: self._deferred.pop(t, None))
+
+    def _trim(self):
+        # Forget the oldest finished jobs once history is full
+        while len(self.jobs) > self.history:
+            oldest_id = next((jid for jid, j in self.jobs.items() if j.finished_at), None)
+            if oldest_id is None:
+                break
+            del self.jobs[oldest_id]
+
+    async def _worker(self, index):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            if job.started_at is None:  # not a deferred job coming back
+                job.started_at = time.time()
+                job.timings["queued"] = round(job.started_at - job.created_at, 3)
+                metrics.observe("tds_stage_duration_seconds", job.started_at - job.created_at, stage="queued")
+            try:
+                result = await self.handler(job.payload, job)
+                job.finish(result=result)
+                metrics.inc("tds_jobs_total", status="succeeded")
+            except Deferred as e:
+                self._defer(job, e.delay, e.stage)
+            except asyncio.CancelledError:  # the pool is stopping: release whoever waits on the job
+                job.finish(error="Server stopped while the job was running")
+                metrics.inc("tds_jobs_total", status="cancelled")
+                raise
+            except Exception as e:
+                print(f"❌ Job {job.id} failed: {e}")
+                job.finish(error=str(e))
+                metrics.inc("tds_jobs_total", status="failed")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import metrics
+
+# Per-nonce leases shared by every worker process (same SQLite file as the nonce store)
+STATE_DB = os.getenv("STATE_DB", "state.db")
+NONCE_LEASE_TTL = float(os.getenv("NONCE_LEASE_TTL", "120"))
+NONCE_LEASE_WAIT = float(os.getenv("NONCE_LEASE_WAIT", "900"))
+NONCE_LEASE_POLL = float(os.getenv("NONCE_LEASE_POLL", "0.5"))
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(STATE_DB, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS nonce_leases (
+                nonce TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                acquired_at REAL,
+                expires_at REAL
+            )
+        """)
+        _conn = conn
+    return _conn
+
+
+def acquire(nonce, owner, ttl=NONCE_LEASE_TTL):
+    """Takes the lease if it is free, expired or already ours. Returns True on success."""
+    now = time.time()
+    with _lock:
+        cur = _connect().execute(
+            "INSERT INTO nonce_leases (nonce, owner, acquired_at, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(nonce) DO UPDATE SET owner = excluded.owner, acquired_at = excluded.acquired_at, "
+            "expires_at = excluded.expires_at WHERE nonce_leases.expires_at < ? OR nonce_leases.owner = excluded.owner",
+            (nonce, owner, now, now + ttl, now),
+        )
+    return cur.rowcount == 1
+
+
+def renew(nonce, owner, ttl=NONCE_LEASE_TTL):
+    """Extends a lease we hold. Returns False if it expired and someone else took it."""
+    with _lock:
+        cur = _connect().execute(
+            "UPDATE nonce_leases SET expires_at = ? WHERE nonce = ? AND owner = ?",
+            (time.time() + ttl, nonce, owner),
+        )
+    return cur.rowcount == 1
+
+
+def release(nonce, owner):
+    with _lock:
+        _connect().execute("DELETE FROM nonce_leases WHERE nonce = ? AND owner = ?", (nonce, owner))
+
+
+@asynccontextmanager
+async def hold(nonce, ttl=NONCE_LEASE_TTL, timeout=NONCE_LEASE_WAIT):
+    """
+    Holds the nonce's lease for the duration of the block, renewing it in the
+    background, and yields how many seconds were spent waiting for it.
+    Raises TimeoutError if the lease stays busy for `timeout` seconds.
+    """
+    if not nonce:
+        yield 0.0
+        return
+
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    started = time.monotonic()
+    delay = 0.05
+    while not await asyncio.to_thread(acquire, nonce, owner, ttl):
+        if time.monotonic() - started > timeout:
+            metrics.inc("tds_nonce_lock_timeouts_total")
+            raise TimeoutError(f"nonce {nonce} is busy (waited {timeout:.0f}s)")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, NONCE_LEASE_POLL)
+    waited = time.monotonic() - started
+    metrics.observe("tds_nonce_lock_wait_seconds", waited)
+    if waited > 0.1:
+        print(f"🔒 Waited {waited:.1f}s for nonce {nonce}")
+
+    async def keep_alive():
+        while True:
+            await asyncio.sleep(ttl / 3)
+            if not await asyncio.to_thread(renew, nonce, owner, ttl):
+                print(f"⚠️ Lost the lease on nonce {nonce}")
+                return
+
+    renewing = asyncio.create_task(keep_alive())
+    try:
+        yield waited
+    finally:
+        renewing.cancel()
+        await asyncio.to_thread(release, nonce, owner)
+
+
+metrics.describe("tds_nonce_lock_wait_seconds", "histogram", "Time jobs waited for their nonce's lease")
+metrics.describe("tds_nonce_lock_timeouts_total", "counter", "Jobs that gave up waiting for their nonce's lease")
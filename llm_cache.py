@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Content-addressed cache of LLM responses keyed by hash(model, messages)
+LLM_CACHE_DB = Path(os.getenv("LLM_CACHE_DB", ".cache/llm_cache.db"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+_conn = None
+_lock = threading.Lock()
+_inflight = {}
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        LLM_CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_DB, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                size INTEGER,
+                created_at REAL,
+                last_access REAL
+            );
+            CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access);
+        """)
+        _conn = conn
+    return _conn
+
+
+def cache_key(model, messages):
+    raw = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    """Returns the cached response dict, or None if missing or expired."""
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > LLM_CACHE_TTL:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+    return json.loads(row[0])
+
+
+def put(key, model, response):
+    """Stores a response and evicts least-recently-used entries beyond LLM_CACHE_MAX_BYTES."""
+    body = json.dumps(response)
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, body, len(body), now, now),
+        )
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - LLM_CACHE_TTL,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > LLM_CACHE_MAX_BYTES:
+            evicted = 0
+            for old_key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                if total <= LLM_CACHE_MAX_BYTES:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= size
+                evicted += 1
+            print(f"🧹 Evicted {evicted} LLM cache entr{'y' if evicted == 1 else 'ies'}")
+
+
+async def cached_call(model, messages, fetch, bypass=False):
+    """
+    Returns the response for (model, messages), calling `fetch()` only on a miss.
+    Concurrent identical prompts share a single in-flight call.
+    With bypass=True the cache is not read (the fresh result is still stored).
+    Responses are stored under the model that answered, so a fallback's answer is not
+    returned to later calls for `model`.
+    """
+    key = cache_key(model, messages)
+    if not bypass:
+        cached = await asyncio.to_thread(get, key)
+        if cached is not None:
+            print(f"⚡ LLM cache hit {key[:12]}")
+            return cached
+        if key in _inflight:
+            print(f"🔗 Joining in-flight LLM call {key[:12]}")
+            return await asyncio.shield(_inflight[key])
+
+    future = asyncio.get_running_loop().create_future()
+    if not bypass:
+        _inflight[key] = future
+    try:
+        response = await fetch()
+        answered_by = response.get("model", model)
+        if answered_by != model:  # a fallback answered: never serve it as `model`'s answer
+            print(f"↪️ Caching the {answered_by} fallback answer under its own model")
+        await asyncio.to_thread(put, cache_key(answered_by, messages), answered_by, response)
+        future.set_result(response)
+        return response
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        if _inflight.get(key) is future:
+            del _inflight[key]
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+import clients
+import metrics
+from streaming import stream_chat_completion
+
+# LLM request layer: hedging after an adaptive latency threshold, then fallbacks on errors/timeouts
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "600"))
+LLM_STALL_TIMEOUT = float(os.getenv("LLM_STALL_TIMEOUT", "60"))  # max silence between streamed chunks
+# "model" or "model@url" entries tried in order when the requested model fails
+LLM_FALLBACKS = [m.strip() for m in os.getenv("LLM_FALLBACKS", "").split(",") if m.strip()]
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "90"))  # until enough latencies are known
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "5"))
+LLM_LATENCY_WINDOW = 50
+LLM_LATENCY_MIN_SAMPLES = 5
+
+_latencies = {}  # model -> recent successful call durations
+
+
+def record_latency(model, seconds):
+    _latencies.setdefault(model, deque(maxlen=LLM_LATENCY_WINDOW)).append(seconds)
+    metrics.observe("tds_llm_latency_seconds", seconds, model=model)
+
+
+def hedge_delay(model):
+    """Seconds to wait before hedging: the model's recent p90 latency (LLM_HEDGE_QUANTILE)."""
+    samples = sorted(_latencies.get(model, ()))
+    if len(samples) < LLM_LATENCY_MIN_SAMPLES:
+        return LLM_HEDGE_DELAY
+    quantile = samples[min(len(samples) - 1, int(LLM_HEDGE_QUANTILE * len(samples)))]
+    return max(LLM_HEDGE_MIN_DELAY, quantile)
+
+
+def latency_stats():
+    return {
+        model: {"samples": len(s), "hedge_delay": round(hedge_delay(model), 3)}
+        for model, s in _latencies.items()
+    }
+
+
+def targets(model, url, fallbacks=()):
+    """The requested (model, url) followed by `fallbacks` and then the configured LLM_FALLBACKS."""
+    chain = [(model, url)]
+    for entry in [*fallbacks, *LLM_FALLBACKS]:
+        fallback_model, _, fallback_url = entry.partition("@")
+        target = (fallback_model, fallback_url or url)
+        if target not in chain:
+            chain.append(target)
+    return chain
+
+
+async def _attempt(model, url, payload, headers, parser):
+    started = time.monotonic()
+    import httpx  # loaded on first use, see clients
+
+    body = {**payload, "model": model}
+    timeout = httpx.Timeout(LLM_STALL_TIMEOUT, connect=30)
+
+    async def request():
+        with metrics.external_call("llm", model):
+            return await stream_chat_completion(
+                url, body, headers, parser,
+                client=clients.async_http(), on_headers=clients.observe_llm_headers, timeout=timeout,
+            )
+
+    response = await asyncio.wait_for(clients.llm_call(request), LLM_TIMEOUT)
+    record_latency(model, time.monotonic() - started)
+    response["model"] = model
+    return response
+
+
+async def _hedged(model, url, payload, headers, make_parser):
+    # one request, plus a second identical one if the first is slower than usual; first to finish wins
+    attempts = {}
+
+    def launch(kind):
+        parser = make_parser()
+        attempts[asyncio.create_task(_attempt(model, url, payload, headers, parser))] = (parser, kind)
+
+    launch("primary")
+    delay = hedge_delay(model) if LLM_HEDGE else None
+    pending = set(attempts)
+    error = None
+    try:
+        while pending:
+            timeout = delay if len(attempts) == 1 else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"🪃 {model} slower than {delay:.1f}s, sending a hedged request")
+                metrics.inc("tds_llm_hedges_total", model=model, outcome="fired")
+                launch("hedge")
+                pending = {t for t in attempts if not t.done()}
+                continue
+            for task in done:
+                if task.exception() is None:
+                    parser, kind = attempts[task]
+                    if kind == "hedge":
+                        metrics.inc("tds_llm_hedges_total", model=model, outcome="won")
+                    response = task.result()
+                    response["hedged"] = len(attempts) > 1
+                    return response, parser
+                error = task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            task.cancel()
+        await asyncio.gather(*attempts, return_exceptions=True)
+
+
+async def complete(url, payload, headers, make_parser, fallbacks=()):
+    """
+    Streams a chat completion for payload["model"], hedging slow requests and
+    falling back to `fallbacks` and LLM_FALLBACKS on errors or timeouts.
+    Returns (response, parser) where parser is the one fed by the winning stream.
+    """
+    import httpx
+
+    error = None
+    for model, target_url in targets(payload["model"], url, fallbacks):
+        try:
+            return await _hedged(model, target_url, payload, headers, make_parser)
+        except (httpx.HTTPError, asyncio.TimeoutError, ValueError) as e:
+            error = e
+            metrics.inc("tds_llm_fallbacks_total", model=model)
+            print(f"⚠️ LLM {model} failed ({type(e).__name__}: {e}), trying the next model")
+    raise error
+
+
+metrics.describe("tds_llm_latency_seconds", "histogram", "Successful LLM call duration per model")
+metrics.describe("tds_llm_hedges_total", "counter", "Hedged LLM requests fired and won")
+metrics.describe("tds_llm_fallbacks_total", "counter", "LLM calls that failed over to the next model")
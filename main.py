@@ -1,440 +1,740 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # cold start timing, reported once the lifespan has started
+
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, HTMLResponse
-import json,re
-import os, time
-import requests, pathlib,httpx
+from fastapi.responses import Response
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+import json,base64
+import os, asyncio, contextvars, uuid
 from dotenv import load_dotenv
-from github import Github
-from pathlib import Path
-from github.GithubException import GithubException
+load_dotenv()  # before the local modules below read their settings
+from concurrent.futures import ThreadPoolExecutor
+from jobs import JobQueue, Deferred
+import snapshots
+import nonce_store
+import llm_cache
+from streaming import CodeBlockStream
+import outbox
+from prompt_context import build_update_context
+import metrics
+import clients
+import batch
+import pages
+import attachments as attachments_mod
+import leases
+import llm_client
+import idempotency
+import routing
+import homepage
+import ingest
+from clients import get_github, github_call
 
 # Load secret from .env file
-load_dotenv()
 MY_SECRET = os.getenv("MY_SECRET")
 api_key=os.getenv("API_KEY")
+LLM_API_URL = os.getenv("LLM_API_URL", "https://aipipe.org/openai/v1/chat/completions")
 
 # Load GitHub credentials
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_USERNAME = os.getenv("GITHUB_USERNAME")
-NONCE_TRACKER_FILE = Path("nonce_tracker.json")
-
-app = FastAPI()
 
-with open("index.html", "r", encoding="utf-8") as f:
-    HOME_HTML = f.read()
+# Concurrent blob uploads per commit (binary files)
+BLOB_UPLOAD_WORKERS = int(os.getenv("BLOB_UPLOAD_WORKERS", "4"))
+
+# A later round waits (deferred, off the workers) this long for round 1 to create its nonce's repo
+NONCE_ROUND_WAIT = float(os.getenv("NONCE_ROUND_WAIT", "600"))
+# ...but fails after this long if no earlier round of the nonce has even been submitted
+NONCE_ROUND_GRACE = float(os.getenv("NONCE_ROUND_GRACE", "2"))
+
+# Request payload logging (off by default, truncated, secret redacted)
+LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "").lower() in ("1", "true", "yes")
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+def log_payload(data):
+    if not LOG_PAYLOADS:
+        return
+    text = json.dumps({**data, "secret": "***"} if "secret" in data else data)
+    if len(text) > LOG_PAYLOAD_MAX_CHARS:
+        text = text[:LOG_PAYLOAD_MAX_CHARS] + f"... ({len(text)} chars)"
+    print(text)
+
+# Seconds spent importing main, in the lifespan startup and since the process started
+STARTUP = {}
+
+@asynccontextmanager
+async def lifespan(app):
+    global home_page
+    STARTUP["import"] = round(IMPORTED - IMPORT_STARTED, 3)
+    started = time.perf_counter()
+    home_page = homepage.Page.load()
+    await clients.start()
+    await job_queue.start()
+    await dispatcher.start()
+    claims_alive = asyncio.create_task(idempotency.keep_alive())
+    STARTUP["lifespan"] = round(time.perf_counter() - started, 3)
+    STARTUP["process"] = metrics.process_uptime()
+    print(f"🚀 Ready: imports {STARTUP['import']}s, startup {STARTUP['lifespan']}s, "
+          f"process up {STARTUP['process']}s")
+    yield
+    await job_queue.stop()
+    claims_alive.cancel()
+    await build_watcher.stop()
+    await dispatcher.stop()
+    await clients.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+home_page = None  # homepage.Page, loaded and compressed in the lifespan
 
 @app.get("/", response_class=HTMLResponse)
-async def home():
-    return HOME_HTML
+async def home(request: Request):
+    status, body, headers = home_page.respond(request.headers)
+    return Response(body, status_code=status, headers=headers, media_type=home_page.media_type)
 
 
-@app.post("/api-endpoint")
+@app.post("/api-endpoint", status_code=202)
 async def receive_task(request: Request):
     try:
-        data = await request.json()  # Parse JSON request
         print("\n--- New Request Received ---")
-        print(json.dumps(data, indent=2))
-
-        # 1️⃣ Verify the secret
-        if data.get("secret") != MY_SECRET:
-            return JSONResponse({"error": "Invalid secret"}, status_code=403)
-
-        # 2️⃣ Extract important fields
-        email = data.get("email")
-        task = data.get("task")
-        round_num = data.get("round")
-        brief = data.get("brief")
-        evaluation_url = data.get("evaluation_url")
-        attachments = data.get("attachments", [])
-        nonce=data.get("nonce")
-
-        print(f"✅ Verified secret for {email}")
-        print(f"📋 Task: {task}")
-        print(f"🧾 Round: {round_num}")
-        print(f"🧠 Brief: {brief}")
-        print(f"📦 Attachments: {len(attachments)} file(s)")
-        print(f"🧩 Evaluation URL: {evaluation_url}")
-
-
-        # 3️⃣ Generate app code using LLM
-        print("\n🤖 Generating code using LLM...")
-
-        # Load nonce tracker data
-        if NONCE_TRACKER_FILE.exists():
-            with open(NONCE_TRACKER_FILE, "r", encoding="utf-8") as f:
-                nonce_data = json.load(f)
-        else:
-            nonce_data = {}
 
-        # Check if this nonce already has a repo
-        existing_repo_url = None
-        commit_sha=None
-        if nonce in nonce_data:
-            existing_repo_url = nonce_data[nonce]["repo_url"]
+        # 1️⃣ Parse the body as it streams in, refusing bad secrets, bad fields and
+        # oversized bodies early; attachments are spooled to the store on the way
+        try:
+            with metrics.span("ingest"):
+                data = await ingest.read_task(request.stream(), MY_SECRET, request.headers.get("content-length"))
+        except ingest.Rejected as e:
+            metrics.inc("tds_requests_total", result=e.reason)
+            return JSONResponse({"error": str(e)}, status_code=e.status)
+        log_payload(data)
+
+        # 2️⃣ Short-circuit re-sends of a task that is running or already done
+        key = idempotency.task_key(data)
+        job_id = uuid.uuid4().hex
+        existing = await asyncio.to_thread(idempotency.claim, key, job_id, data.get("nonce"), data.get("round"))
+        if existing:
+            return duplicate_response(existing)
+
+        # 3️⃣ Queue the task for the worker pool
+        try:
+            job = job_queue.submit(data, job_id)
+        except asyncio.QueueFull:
+            await asyncio.to_thread(idempotency.forget, key, job_id)
+            metrics.inc("tds_requests_total", result="queue_full")
+            return JSONResponse(
+                {"error": "Job queue is full, retry later"},
+                status_code=503,
+                headers={"Retry-After": "30"}
+            )
 
-        # --- CASE 1️⃣: New nonce → create new repo ---
-        if not existing_repo_url:
-            print(f"🆕 New nonce detected: creating repo for task {task}")
-        
-            checks_section=""
-            if data.get("checks"):
-                checks_section=f"""
-                ### EVALUATION CHECKS ###
-                The following checks describe how your generated application will be automatically evaluated.
-                You MUST implement all features, behaviors, and conditions implied by these checks.
-                Do not rewrite or repeat these checks in the output.
-                Use them only to guide your implementation and ensure the final app passes them successfully.
-                {chr(10).join([f"- {check}" for check in data['checks']])}
-                """
-            
-            attach=""
-            if attachments:
-                attachment_details="\n".join(
-                    [f"- {att['name']}: {att['url']}" for att in attachments]
-                )
-                attach=f"""
-                ### ATTACHMENTS ###
-                The following sample files are provided as reference inputs for your task.
-
-                {attachment_details}
-
-                - Each attachment URL is base64-encoded or embedded data. 
-                - Use these attachments only when the task brief does NOT provide a direct input (e.g., a ?url parameter). 
-                - If the task brief mentions its own file or input, prefer that instead.
-                - Do NOT reproduce the attachment content in your output — just reference it logically in your generated code.
-                - If the app requires an image or data source, default to these attachments where applicable.
-                """
-
-            prompt = f"""
-            You are an expert full-stack web developer with years of experience building clean, production-grade applications.
-
-            Based on the following task brief, generate **only the complete and functional code** required — typically limited to:
-            - `index.html`
-            - `styles.css`
-            - `script.js`
-            - `README.md`
-
-            Do NOT create any extra files unless they are explicitly required by the task.
-
-            ### TASK ###
-            {brief}
-            {attach}
-            {checks_section}
-
-            ### README REQUIREMENTS ###
-            The `README.md` file must:
-            1. Be a **pure Markdown file** (not HTML).
-            2. Contain a **professional and structured** documentation including:
-            - Project Overview
-            - Features
-            - Setup Instructions
-            - Usage Guide
-            - Code Structure
-            - License (MIT)
-            3. Use **Markdown syntax only** — no HTML or JavaScript.
-            4. Be saved as a file named exactly `README.md`.
-
-            ### OUTPUT RULES ###
-            - Output **only code blocks**, nothing else.
-            - Each file must start with ```filename.ext and end with ``` exactly.
-            - Filenames must be one of: `index.html`, `styles.css`, `script.js`, or `README.md`.
-            - Do NOT output or reference any other filenames (like file_5.html, file_6.html, etc.).
-            - Do NOT include explanations or text outside the code blocks.
-            - Keep all filenames lowercase and consistent.
+        metrics.inc("tds_requests_total", result="accepted")
+        print(f"📥 Queued job {job.id} (queue depth {job_queue.depth()})")
+        return JSONResponse(
+            {"status": "202 Accepted",
+             "message": "Task queued successfully. Poll the status URL for progress.",
+             "job_id": job.id,
+             "status_url": f"/jobs/{job.id}",
+            },
+            status_code=202
+        )
 
-            """
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
 
 
-            url= "https://aipipe.org/openai/v1/chat/completions"
-            headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            }
+def duplicate_response(record):
+    """Answers a re-sent task from its existing execution: the stored result, or its job to poll."""
+    status_url = f"/jobs/{record['job_id']}"
+    if record["status"] == "succeeded":
+        metrics.inc("tds_requests_total", result="duplicate_done")
+        print(f"♻️ Duplicate of finished job {record['job_id']}, returning its result")
+        return JSONResponse(
+            {"status": "200 OK",
+             "message": "Task already completed.",
+             "job_id": record["job_id"],
+             "status_url": status_url,
+             **(record["result"] or {}),
+            },
+            status_code=200
+        )
+    metrics.inc("tds_requests_total", result="duplicate_inflight")
+    print(f"♻️ Duplicate of running job {record['job_id']}")
+    return JSONResponse(
+        {"status": "202 Accepted",
+         "message": "This task is already being processed. Poll the status URL for progress.",
+         "job_id": record["job_id"],
+         "status_url": status_url,
+        },
+        status_code=202
+    )
+
+
+# many task payloads at once (JSON array or JSONL), results streamed back as NDJSON
+@app.post("/batch")
+async def receive_batch(request: Request, concurrency: int = batch.BATCH_CONCURRENCY):
+    try:
+        body = await ingest.read_body(request.stream(), request.headers.get("content-length"))
+        payloads = batch.parse_payloads(body)
+    except ingest.Rejected as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid batch: {e}"}, status_code=400)
+    print(f"\n--- Batch of {len(payloads)} task(s) received ---")
+
+    def validate(payload):
+        try:
+            ingest.validate(payload, MY_SECRET)
+        except ingest.Rejected as e:
+            metrics.inc("tds_requests_total", result=e.reason)
+            return str(e)
+        metrics.inc("tds_requests_total", result="accepted")
+        return None
+
+    async def results():
+        async for result in batch.run_batch(payloads, run_once, concurrency, validate):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    body = metrics.render() + (
+        "# HELP tds_job_queue_depth Jobs waiting for a worker\n"
+        "# TYPE tds_job_queue_depth gauge\n"
+        f"tds_job_queue_depth {job_queue.depth()}\n"
+        "# HELP tds_llm_hedge_delay_seconds Current hedging threshold per model\n"
+        "# TYPE tds_llm_hedge_delay_seconds gauge\n"
+    )
+    for model, stats in llm_client.latency_stats().items():
+        body += f'tds_llm_hedge_delay_seconds{{model="{model}"}} {stats["hedge_delay"]}\n'
+    body += "# HELP tds_startup_seconds Cold start time by phase\n# TYPE tds_startup_seconds gauge\n"
+    for phase, seconds in STARTUP.items():
+        if seconds is not None:
+            body += f'tds_startup_seconds{{phase="{phase}"}} {seconds}\n'
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # queued by another worker process, or already dropped from history
+    record = await asyncio.to_thread(idempotency.get_by_job, job_id)
+    if record is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return {"job_id": job_id, "status": record["status"], "nonce": record["nonce"], "round": record["round"],
+            "result": record["result"], "error": record["error"]}
+
+
+# run a task (or join an identical one that is already running) and wait for the outcome
+async def run_once(data):
+    key = idempotency.task_key(data)
+    while True:
+        job_id = uuid.uuid4().hex
+        record = await asyncio.to_thread(idempotency.claim, key, job_id, data.get("nonce"), data.get("round"))
+        if record:
+            job = job_queue.get(record["job_id"])
+        else:
+            try:
+                job = await job_queue.put(data, job_id)
+            except BaseException:
+                await asyncio.shield(asyncio.to_thread(idempotency.forget, key, job_id))
+                raise
+        if job is not None:
+            await job.wait()
+            return {"job_id": job.id, "status": job.status, "result": job.result, "error": job.error,
+                    "timings": job.timings, "duplicate": record is not None}
+
+        # running in another worker process: follow its record
+        delay = 0.2
+        while record is not None and record["status"] == "running":
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5)
+            record = await asyncio.to_thread(idempotency.get, key)
+        if record is not None and record["status"] in ("succeeded", "failed"):
+            return {"job_id": record["job_id"], "status": record["status"], "result": record["result"],
+                    "error": record["error"], "duplicate": True}
+        # the claim was dropped (its job never got queued) or abandoned: claim it again and run it here
+
+
+# one task at a time per nonce, across job workers and uvicorn processes
+def awaits_first_round(data):
+    """True for a round > 1 whose nonce has no repo yet, which it must not create itself."""
+    round_num = data.get("round")
+    return isinstance(round_num, int) and round_num > 1 and not nonce_store.get(data.get("nonce"))
+
+
+async def process_task_exclusive(data, job):
+    """
+    Runs process_task while holding the nonce's lease (the wait is recorded on the job),
+    after round 1 for later rounds, and stores the outcome for duplicate submissions.
+    """
+    metrics.set_tags(job=job.id, task=data.get("task"), nonce=data.get("nonce"), round=data.get("round"))
+    key = idempotency.task_key(data)
+    nonce, round_num = data.get("nonce"), data.get("round")
+    job.set_stage("nonce_lock")
+    try:
+        async with leases.hold(nonce) as waited:
+            job.metrics["nonce_lock_wait"] = round(job.metrics.get("nonce_lock_wait", 0) + waited, 3)
+            if await asyncio.to_thread(awaits_first_round, data):
+                # the repo comes from round 1: wait for it off the workers if it is on its way
+                waited_rounds = job.metrics.get("round_wait", 0)
+                if waited_rounds >= NONCE_ROUND_GRACE and not await asyncio.to_thread(
+                    idempotency.earlier_round_running, nonce, round_num
+                ):
+                    raise RuntimeError(f"Round {round_num} of nonce {nonce} has no repo to update "
+                                       f"and no earlier round is queued or running")
+                if waited_rounds >= NONCE_ROUND_WAIT:
+                    metrics.inc("tds_round_wait_timeouts_total")
+                    raise RuntimeError(f"Round {round_num} of nonce {nonce} gave up waiting for round 1 "
+                                       f"to create its repo (waited {waited_rounds:.0f}s)")
+                delay = min(max(waited_rounds, 0.5), 5)
+                job.metrics["round_wait"] = round(waited_rounds + delay, 3)
+                raise Deferred(delay, stage="round_wait")
+            result = await process_task(data, job)
+    except Deferred:
+        raise
+    except BaseException as e:  # including cancellation at shutdown, so a re-send can run it again
+        error = str(e) or type(e).__name__
+        await asyncio.shield(asyncio.to_thread(idempotency.finish, key, job.id, error=error))
+        raise
+    await asyncio.to_thread(idempotency.finish, key, job.id, result=result)
+    return result
+
+
+# runs one queued task: generate, push and notify
+async def process_task(data, job):
+    """
+    Builds or updates the app for one task payload and
+    returns {repo_url, pages_url, commit_sha}.
+    """
+    # 2️⃣ Extract important fields
+    email = data.get("email")
+    task = data.get("task")
+    round_num = data.get("round")
+    brief = data.get("brief")
+    evaluation_url = data.get("evaluation_url")
+    attachments = data.get("attachments", [])
+    nonce=data.get("nonce")
+    no_cache = bool(data.get("no_cache"))
+    metrics.set_tags(job=job.id, task=task, nonce=nonce, round=round_num)
+
+    print(f"✅ Verified secret for {email}")
+    print(f"📋 Task: {task}")
+    print(f"🧾 Round: {round_num}")
+    print(f"🧠 Brief: {brief}")
+    print(f"📦 Attachments: {len(attachments)} file(s)")
+    print(f"🧩 Evaluation URL: {evaluation_url}")
+
+
+    # Decode attachments into the store once; only compact references stay in the payload
+    if attachments:
+        job.set_stage("attachments")
+        attachments = await asyncio.to_thread(attachments_mod.store_all, attachments)
+        data["attachments"] = attachments
+        job.metrics["attachment_bytes"] = sum(a.get("size", 0) for a in attachments)
+
+    # 3️⃣ Generate app code using LLM
+    print("\n🤖 Generating code using LLM...")
+    job.set_stage("prompt")
+
+    # Check if this nonce already has a repo
+    existing_repo_url = None
+    commit_sha=None
+    record = await asyncio.to_thread(nonce_store.get, nonce)
+    if record:
+        existing_repo_url = record["repo_url"]
+        commit_sha = record["commit_sha"]
+
+    # --- CASE 1️⃣: New nonce → create new repo ---
+    if not existing_repo_url:
+        print(f"🆕 New nonce detected: creating repo for task {task}")
+    
+        checks_section=""
+        if data.get("checks"):
+            checks_section=f"""
+            ### EVALUATION CHECKS ###
+            The following checks describe how your generated application will be automatically evaluated.
+            You MUST implement all features, behaviors, and conditions implied by these checks.
+            Do not rewrite or repeat these checks in the output.
+            Use them only to guide your implementation and ensure the final app passes them successfully.
+            {chr(10).join([f"- {check}" for check in data['checks']])}
+            """
+        
+        attach=""
+        if attachments:
+            attachment_details=attachments_mod.describe(attachments)
+            attach=f"""
+            ### ATTACHMENTS ###
+            The following sample files are provided as reference inputs for your task.
+            They are committed to the repository root next to index.html, so load them by relative path (e.g. `fetch("data.csv")`, `<img src="logo.png">`).
+
+            {attachment_details}
+
+            - Use these attachments only when the task brief does NOT provide a direct input (e.g., a ?url parameter). 
+            - If the task brief mentions its own file or input, prefer that instead.
+            - Do NOT reproduce the attachment content in your output and do NOT output files with these names — just reference them in your generated code.
+            - If the app requires an image or data source, default to these attachments where applicable.
+            """
 
-            payload = {
-            "model": "anthropic/claude-sonnet-4.5",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
+        prompt = f"""
+        You are an expert full-stack web developer with years of experience building clean, production-grade applications.
+
+        Based on the following task brief, generate **only the complete and functional code** required — typically limited to:
+        - `index.html`
+        - `styles.css`
+        - `script.js`
+        - `README.md`
+
+        Do NOT create any extra files unless they are explicitly required by the task.
+
+        ### TASK ###
+        {brief}
+        {attach}
+        {checks_section}
+
+        ### README REQUIREMENTS ###
+        The `README.md` file must:
+        1. Be a **pure Markdown file** (not HTML).
+        2. Contain a **professional and structured** documentation including:
+        - Project Overview
+        - Features
+        - Setup Instructions
+        - Usage Guide
+        - Code Structure
+        - License (MIT)
+        3. Use **Markdown syntax only** — no HTML or JavaScript.
+        4. Be saved as a file named exactly `README.md`.
+
+        ### OUTPUT RULES ###
+        - Output **only code blocks**, nothing else.
+        - Each file must start with ```filename.ext and end with ``` exactly.
+        - Filenames must be one of: `index.html`, `styles.css`, `script.js`, or `README.md`.
+        - Do NOT output or reference any other filenames (like file_5.html, file_6.html, etc.).
+        - Do NOT include explanations or text outside the code blocks.
+        - Keep all filenames lowercase and consistent.
+
+        """
+
+
+        url= LLM_API_URL
+        headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        }
+
+        route = routing.route(data)
+        payload = {
+        "model": route["model"],
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
             }
+        ]
+        }
+
+        job.set_stage("llm")
+        generated_files = await generate_files(url, payload, headers, brief, job, bypass_cache=no_cache, route=route)
 
-            response = httpx.post(url, json=payload, headers=headers, timeout=600)
-            response.raise_for_status()
-            data = response.json()
-
-
-            generated_code = data["choices"][0]["message"]["content"].strip()
-
-            generated_files = extract_code_blocks(generated_code,brief)
-
-            
-            
-            # pushing the code in github
-
-            result=push_to_github(task, brief, generated_files,nonce)
-
-            # Handle name conflict gracefully
-            if isinstance(result,dict) and result.get("error")=="name_conflict":
-                return JSONResponse(
-                    {"error": result['message']},
-                    status_code=409
-                )
-            
-            repo_url, pages_url,commit_sha=result
-            
-            # notify the evaluation server about the deployment
-            if evaluation_url:
-                payload1 = {
-                    "email": email,
-                    "task": task,
-                    "round": round_num,
-                    "nonce": nonce,
-                    "pages_url": pages_url,
-                    "repo_url":repo_url,
-                    "commit_sha":commit_sha
-                }
-
-                headers = {"Content-Type": "application/json"}
-                delay = 1
-                for attempt in range(5):
-                    try:
-                        response = httpx.post(evaluation_url, json=payload1, headers=headers, timeout=60)
-                        if response.status_code == 200:
-                            print(f"✅ Successfully notified evaluation server: {evaluation_url}")
-                            break
-                        else:
-                            print(f"⚠️ Server responded with {response.status_code}, retrying...")
-                    except Exception as e:
-                        print(f"⚠️ Notification attempt {attempt+1} failed: {e}")
-                    time.sleep(delay)
-                    delay *= 2  # exponential backoff
-            
-            # 3️⃣ Respond OK
-            return {"status": "200 ok", 
-                    "message": f"Task received successfully. Notification sent to {evaluation_url}",
-                    "pages_url": pages_url,
-                }
         
         
+        # pushing the code in github
+
+        job.set_stage("push")
+        result=await asyncio.to_thread(push_to_github, task, brief, generated_files, nonce, email, attachments)
+
+        # Handle name conflict gracefully
+        if isinstance(result,dict) and result.get("error")=="name_conflict":
+            raise RuntimeError(result['message'])
         
+        repo_url, pages_url,commit_sha=result
+        if not repo_url:
+            raise RuntimeError("GitHub repo creation failed")
         
-        # --- CASE 2️⃣: Existing nonce → update existing repo ---
-        else:
-            print(f"🔁 Existing nonce found. Updating repo: {existing_repo_url}")
-            existing_files = get_existing_code_from_repo(existing_repo_url)
-
-            checks_section=""
-            if data.get("checks"):
-                checks_section=f"""
-                ### EVALUATION CHECKS ###
-                The following checks describe how your generated application will be automatically evaluated.
-                You MUST implement all features, behaviors, and conditions implied by these checks.
-                Do not rewrite or repeat these checks in the output.
-                Use them only to guide your implementation and ensure the final app passes them successfully.
-                {chr(10).join([f"- {check}" for check in data['checks']])}
-                """
-            
-            attach=""
-            if attachments:
-                attachment_details="\n".join(
-                    [f"- {att['name']}: {att['url']}" for att in attachments]
-                )
-                attach=f"""
-                ### ATTACHMENTS ###
-                The following sample files are provided as reference inputs for your task.
-
-                {attachment_details}
-
-                - Each attachment URL is base64-encoded or embedded data. 
-                - Use these attachments only when the task brief does NOT provide a direct input (e.g., a ?url parameter). 
-                - If the task brief mentions its own file or input, prefer that instead.
-                - Do NOT reproduce the attachment content in your output — just reference it logically in your generated code.
-                - If the app requires an image or data source, default to these attachments where applicable.
-                """
-            
-            prompt = f"""
-            You are an experienced full-stack web developer responsible for updating an existing production-grade web application.
-
-            Your goal is to **modify only the necessary parts** of the existing codebase based on the update instructions below — without rebuilding the project or changing its structure.
-
-            ### EXISTING CODEBASE ###
-            Below are all files currently in the application.
-            Each file is separated by its filename header.
-            Review all code carefully before making changes.
-
-            {chr(10).join([f"--- {name} ---\n{code}" for name, code in existing_files.items()])}
-
-            ### UPDATE INSTRUCTIONS ###
-            {brief}
-            {attach}
-            {checks_section}
-
-            ### RULES ###
-            - Do NOT create new files unless the update instructions explicitly require it.
-            - Use the **exact same filenames** as shown above.
-            - Preserve all existing functionality, layout, and design unless specifically asked to modify.
-            - Keep the **project structure identical** (same folders, same file names).
-            - Update only the **relevant sections** of each file — do not rewrite the entire file if not needed.
-            - Ensure the updated code remains clean, functional, and error-free.
-            - Always update the `README.md` file to accurately describe the new changes and reflect the current version.
-            - Keep the README.md strictly in Markdown format (no HTML or JS).
-            - Return the output as **only valid code blocks**:
-            - Each code block must start with ```filename.ext and end with ``` exactly.
-            - Do NOT include any text, explanation, or markdown outside code blocks.
-            - Filenames must match exactly one of the existing ones (no `file_5.html`, `update.js`, etc.).
-            - Maintain consistent indentation and formatting.
-            - Ensure compatibility between updated files (e.g., JS selectors match HTML elements).
+        # notify the evaluation server about the deployment
+        if evaluation_url:
+            payload1 = {
+                "email": email,
+                "task": task,
+                "round": round_num,
+                "nonce": nonce,
+                "pages_url": pages_url,
+                "repo_url":repo_url,
+                "commit_sha":commit_sha
+            }
 
+            job.set_stage("notify")
+            await notify_when_live(job, evaluation_url, payload1)
+        
+        return {"repo_url": repo_url, "pages_url": pages_url, "commit_sha": commit_sha}
+    
+    
+    
+    
+    # --- CASE 2️⃣: Existing nonce → update existing repo ---
+    else:
+        print(f"🔁 Existing nonce found. Updating repo: {existing_repo_url}")
+        job.set_stage("fetch_existing")
+        existing_files = await asyncio.to_thread(get_existing_code_from_repo, existing_repo_url, commit_sha)
+        # token counting (and tiktoken's first load) is CPU and disk work: keep it off the event loop
+        existing_code, context_stats = await asyncio.to_thread(
+            build_update_context, existing_files, brief, data.get("checks")
+        )
+        job.metrics["context_tokens"] = context_stats["tokens"]
+        job.metrics["context_summarized_files"] = context_stats["summarized"]
+        print(f"🧮 Update context: {context_stats['tokens']} tokens, {len(context_stats['full'])} full, "
+              f"{len(context_stats['summarized'])} summarized, {context_stats['excluded']} excluded")
+
+        checks_section=""
+        if data.get("checks"):
+            checks_section=f"""
+            ### EVALUATION CHECKS ###
+            The following checks describe how your generated application will be automatically evaluated.
+            You MUST implement all features, behaviors, and conditions implied by these checks.
+            Do not rewrite or repeat these checks in the output.
+            Use them only to guide your implementation and ensure the final app passes them successfully.
+            {chr(10).join([f"- {check}" for check in data['checks']])}
+            """
+        
+        attach=""
+        if attachments:
+            attachment_details=attachments_mod.describe(attachments)
+            attach=f"""
+            ### ATTACHMENTS ###
+            The following sample files are provided as reference inputs for your task.
+            They are committed to the repository root next to index.html, so load them by relative path (e.g. `fetch("data.csv")`, `<img src="logo.png">`).
+
+            {attachment_details}
+
+            - Use these attachments only when the task brief does NOT provide a direct input (e.g., a ?url parameter). 
+            - If the task brief mentions its own file or input, prefer that instead.
+            - Do NOT reproduce the attachment content in your output and do NOT output files with these names — just reference them in your generated code.
+            - If the app requires an image or data source, default to these attachments where applicable.
             """
+        
+        prompt = f"""
+        You are an experienced full-stack web developer responsible for updating an existing production-grade web application.
+
+        Your goal is to **modify only the necessary parts** of the existing codebase based on the update instructions below — without rebuilding the project or changing its structure.
+
+        ### EXISTING CODEBASE ###
+        Below are the files currently in the application (boilerplate is left out; large or less relevant files are summarized).
+        Each file is separated by its filename header.
+        Review all code carefully before making changes.
+
+        {existing_code}
+
+        ### UPDATE INSTRUCTIONS ###
+        {brief}
+        {attach}
+        {checks_section}
+
+        ### RULES ###
+        - Do NOT create new files unless the update instructions explicitly require it.
+        - Use the **exact same filenames** as shown above.
+        - Files marked "summary only" are shown in outline; leave them unchanged unless the instructions require editing them.
+        - Preserve all existing functionality, layout, and design unless specifically asked to modify.
+        - Keep the **project structure identical** (same folders, same file names).
+        - Update only the **relevant sections** of each file — do not rewrite the entire file if not needed.
+        - Ensure the updated code remains clean, functional, and error-free.
+        - Always update the `README.md` file to accurately describe the new changes and reflect the current version.
+        - Keep the README.md strictly in Markdown format (no HTML or JS).
+        - Return the output as **only valid code blocks**:
+        - Each code block must start with ```filename.ext and end with ``` exactly.
+        - Do NOT include any text, explanation, or markdown outside code blocks.
+        - Filenames must match exactly one of the existing ones (no `file_5.html`, `update.js`, etc.).
+        - Maintain consistent indentation and formatting.
+        - Ensure compatibility between updated files (e.g., JS selectors match HTML elements).
+
+        """
+
+        route = routing.route(data, existing_files)
+        payload={
+            "model":route["model"],
+            "messages":[
+                {"role":"system","content":"You are a professional web developer with years of experiences."},
+                {"role":"user","content":prompt}
+            ]
+        }
+        url= LLM_API_URL
+        headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        }
+        job.set_stage("llm")
+        generated_files = await generate_files(url, payload, headers, brief, job, bypass_cache=no_cache, route=route)
+
+        job.set_stage("push")
+        repo_url, pages_url,commit_sha = await asyncio.to_thread(
+            push_to_github_update, task, brief, generated_files, nonce, attachments
+        )
+        if not repo_url:
+            raise RuntimeError("GitHub repo update failed")
 
-            payload={
-                "model":"anthropic/claude-sonnet-4.5",
-                "messages":[
-                    {"role":"system","content":"You are a professional web developer with years of experiences."},
-                    {"role":"user","content":prompt}
-                ]
-            }
-            url= "https://aipipe.org/openai/v1/chat/completions"
-            headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
+        
+        # notify the evaluation server about the deployment
+        if evaluation_url:
+            payload1 = {
+                "email": email,
+                "task": task,
+                "round": round_num,
+                "nonce": nonce,
+                "pages_url": pages_url,
+                "repo_url":repo_url,
+                "commit_sha":commit_sha
             }
-            response = httpx.post(url, json=payload, headers=headers, timeout=600)
-            response.raise_for_status()
-            data = response.json()
-
-            generated_code = data["choices"][0]["message"]["content"].strip()
-            generated_files = extract_code_blocks(generated_code, brief)
-
-            repo_url, pages_url,commit_sha = push_to_github_update(task, brief, generated_files,nonce)
-
-            
-            # notify the evaluation server about the deployment
-            if evaluation_url:
-                payload1 = {
-                    "email": email,
-                    "task": task,
-                    "round": round_num,
-                    "nonce": nonce,
-                    "pages_url": pages_url,
-                    "repo_url":repo_url,
-                    "commit_sha":commit_sha
-                }
-
-                headers = {"Content-Type": "application/json"}
-                delay = 1
-                for attempt in range(5):
-                    try:
-                        response = httpx.post(evaluation_url, json=payload1, headers=headers, timeout=60)
-                        if response.status_code == 200:
-                            print(f"✅ Successfully notified evaluation server: {evaluation_url}")
-                            break
-                        else:
-                            print(f"⚠️ Server responded with {response.status_code}, retrying...")
-                    except Exception as e:
-                        print(f"⚠️ Notification attempt {attempt+1} failed: {e}")
-                    time.sleep(delay)
-                    delay *= 2  # exponential backoff
-            
-            # 3️⃣ Respond OK
-            return {"status": "200 OK", 
-                    "message": f"Task received successfully. Notification sent to {evaluation_url}",
-                    "pages_url": pages_url,
-                }
+
+            job.set_stage("notify")
+            await notify_when_live(job, evaluation_url, payload1)
         
-        # Save nonce tracking
-        """nonce_data[nonce] = {"task": task, "repo_url": repo_url, "pages_url": pages_url}
-            with open(NONCE_TRACKER_FILE, "w", encoding="utf-8") as f:
-                json.dump(nonce_data, f, indent=2)
+        return {"repo_url": repo_url, "pages_url": pages_url, "commit_sha": commit_sha}
 
-            return repo_url, pages_url,commit_sha"""
 
+# a job dropped from the queue at shutdown gives up its claim so a re-send can run it
+async def release_claim(job):
+    await asyncio.to_thread(idempotency.finish, idempotency.task_key(job.payload), job.id, error=job.error)
 
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
-    
+
+job_queue = JobQueue(process_task_exclusive, on_drop=release_claim)
+dispatcher = outbox.Dispatcher()
+build_watcher = pages.BuildWatcher()
+
+
+# queue the evaluation notification, released once GitHub Pages has built the commit
+async def notify_when_live(job, evaluation_url, payload):
+    notification_id = await asyncio.to_thread(
+        outbox.enqueue, evaluation_url, payload, delay=pages.PAGES_BUILD_TIMEOUT
+    )
+    job.metrics["notification_id"] = notification_id
+    repo_name = payload["repo_url"].split("/")[-1]
+    build_watcher.watch(repo_name, payload["commit_sha"], notification_id, job)
+
+
+# --- Notification outbox ---
+@app.get("/notifications")
+async def list_notifications(request: Request, status: str = None, limit: int = 100):
+    if request.headers.get("X-Secret") != MY_SECRET:
+        return JSONResponse({"error": "Invalid secret"}, status_code=403)
+    return await asyncio.to_thread(outbox.list_notifications, status, limit)
+
+
+@app.post("/notifications/{notification_id}/replay")
+async def replay_notification(request: Request, notification_id: int):
+    if request.headers.get("X-Secret") != MY_SECRET:
+        return JSONResponse({"error": "Invalid secret"}, status_code=403)
+    record = await asyncio.to_thread(outbox.replay, notification_id)
+    if record is None:
+        return JSONResponse({"error": "Notification not found"}, status_code=404)
+    return record
+
+
+# call the LLM without blocking the event loop
+async def call_llm(url, payload, headers, bypass_cache=False, make_parser=None, fallbacks=()):
+    """
+    Streams the chat completion and returns (response, parser).
+    Deltas are fed into a parser from `make_parser()` as they arrive; the parser of the
+    winning (possibly hedged or fallback) request is returned, or None for a cache hit.
+    `fallbacks` are models tried before LLM_FALLBACKS if the requested one fails.
+    Responses are cached by (model, messages); identical concurrent calls are collapsed.
+    """
+    used = {}
+
+    async def fetch():
+        response, used["parser"] = await llm_client.complete(
+            url, payload, headers, make_parser or (lambda: CodeBlockStream("")), fallbacks
+        )
+        return response
+
+    data = await llm_cache.cached_call(payload["model"], payload["messages"], fetch, bypass=bypass_cache)
+    return data, used.get("parser")
+
+
+# generate the app files, parsing code blocks while the LLM is still writing
+async def generate_files(url, payload, headers, brief, job, bypass_cache=False, route=None):
+    """
+    Returns {filename: code} from the LLM output, parsed incrementally.
+    Records time-to-first-file, the parser's peak buffer size and the model that answered on the job,
+    and logs the latency and tokens of the routing decision `route` (see routing.route).
+    """
+    def make_parser():
+        return CodeBlockStream(
+            brief, on_file=lambda name, code: print(f"📄 Received {name} ({len(code)} chars)")
+        )
+
+    started = time.monotonic()
+    fallbacks = route["fallbacks"] if route else ()
+    data, parser = await call_llm(url, payload, headers, bypass_cache, make_parser, fallbacks)
+    elapsed = time.monotonic() - started
+    cached = parser is None
+    if parser is None:  # served from cache or from a shared in-flight call
+        parser = make_parser()
+        parser.feed(data["choices"][0]["message"]["content"])
+    files = parser.finish()
+    metrics.record_span("extract_code_blocks", parser.parse_seconds, files=len(files))
+
+    if parser.time_to_first_file is not None:
+        job.metrics["llm_time_to_first_file"] = round(parser.time_to_first_file, 3)
+    job.metrics["llm_output_chars"] = len(data["choices"][0]["message"]["content"])
+    job.metrics["parser_peak_buffer_chars"] = parser.peak_buffer
+    job.metrics["llm_model"] = data.get("model", payload["model"])
+    job.metrics["llm_hedged"] = bool(data.get("hedged"))
+    if route:
+        entry = await asyncio.to_thread(routing.record, route, data, elapsed, payload["messages"], cached=cached)
+        job.metrics["llm_route"] = route["rule"]
+        job.metrics["complexity"] = route["features"]["score"]
+        job.metrics["llm_tokens"] = entry["prompt_tokens"] + entry["completion_tokens"]
+    return files
 
 
 # pushing the genarated code file to GIthub
-def push_to_github(task, brief, generated_files, nonce):
+def push_to_github(task, brief, generated_files, nonce, email=None, attachments=()):
     """
-    Creates a new GitHub repo, uploads generated files, enables Pages, 
+    Creates a new GitHub repo, uploads generated files (plus the stored
+    attachments as real files), enables Pages, 
     and returns (repo_url, pages_url, commit_sha).
+    Independent steps overlap: the files are prepared while the repo is
+    being created, and Pages is enabled alongside the first commit.
     """
+    from github.GithubException import GithubException
+
     try:
         print(f"\n🚀 Starting GitHub repo creation for task: {task}")
 
-        g = Github(GITHUB_TOKEN)
-        user = g.get_user()
+        user = get_github().get_user()
         repo_name = f"{task}"
         #safe_description = " ".join(brief.split())[:300]
 
-        # --- Create repo ---
-        repo = user.create_repo(
-            name=repo_name,
-            #description=f"Auto-generated project: {safe_description}",
-            private=False
-        )
-        repo_url = repo.html_url
-        print(f"✅ Created new repo: {repo_url}")
-
-        commit_sha = None
-
-        # --- Upload generated files ---
-        for filename, content in generated_files.items():
-            result = repo.create_file(
-                path=filename,
-                message=f"Add {filename}",
-                content=content,
-                branch="main"
-            )
-            commit_sha = result["commit"].sha
-            print(f"✅ Uploaded {filename}")
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            # --- Create repo (auto_init gives us a branch to commit on top of) ---
+            creating = pool.submit(contextvars.copy_context().run, create_repo, user, repo_name)
 
-        # --- Add LICENSE (MIT) ---
-        license_text = f"""MIT License
+            # --- Meanwhile add LICENSE (MIT) and attachments, encode binary files ---
+            files = {**attachments_mod.files_for_repo(attachments), **generated_files}
+            files["LICENSE"] = mit_license()
+            encoded = encode_blobs(files)
 
-Copyright (c) {time.strftime('%Y')} {GITHUB_USERNAME}
+            repo = creating.result()
+            repo_url = repo.html_url
+            print(f"✅ Created new repo: {repo_url}")
 
-Permission is hereby granted, free of charge, to any person obtaining a copy
-of this software and associated documentation files (the "Software"), to deal
-in the Software without restriction, including without limitation the rights
-to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
-copies of the Software, and to permit persons to whom the Software is
-furnished to do so, subject to the following conditions:
+            # --- Enable GitHub Pages while the generated files are committed ---
+            enabling = pool.submit(contextvars.copy_context().run, enable_pages, repo_name, repo.default_branch)
 
-The above copyright notice and this permission notice shall be included in
-all copies or substantial portions of the Software.
+            # --- Upload generated files + LICENSE as a single commit ---
+            with metrics.span("commit", files=len(files)):
+                commit_sha = commit_files(repo, files, f"Add generated app for {task}", replace=True, encoded=encoded)
+            snapshots.remember(commit_sha, files)
+            print(f"✅ Uploaded {len(files)} file(s) in commit {commit_sha}")
 
-THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
-IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
-FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
-"""
-        result = repo.create_file("LICENSE", "Add LICENSE", license_text, branch="main")
-        commit_sha = result["commit"].sha
-        print(f"✅ Added LICENSE")
-
-        # --- Enable GitHub Pages ---
-        pages_api = f"https://api.github.com/repos/{GITHUB_USERNAME}/{repo_name}/pages"
-        headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
-        data = {"source": {"branch": "main", "path": "/"}}
-        httpx.post(pages_api, headers=headers, json=data)
+            enabling.result()
         pages_url = f"https://{GITHUB_USERNAME}.github.io/{repo_name}/"
-        print(f"🌐 GitHub Pages enabled at: {pages_url}")
 
         # --- Update nonce tracker ---
-        if NONCE_TRACKER_FILE.exists():
-            with open(NONCE_TRACKER_FILE, "r", encoding="utf-8") as f:
-                nonce_data = json.load(f)
-        else:
-            nonce_data = {}
-
-        nonce_data[nonce] = {"task": task, "repo_url": repo_url, "pages_url": pages_url}
-        with open(NONCE_TRACKER_FILE, "w", encoding="utf-8") as f:
-            json.dump(nonce_data, f, indent=2)
+        nonce_store.put(
+            nonce, task=task, email=email, repo_url=repo_url, pages_url=pages_url, commit_sha=commit_sha
+        )
 
         print("✅ Repo successfully created and tracked.")
         return repo_url, pages_url, commit_sha
@@ -456,9 +756,47 @@ FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
         return None, None, None
 
 
+def create_repo(user, repo_name):
+    with metrics.span("repo_create"):
+        return github_call(
+            "create_repo", user.create_repo,
+            name=repo_name,
+            #description=f"Auto-generated project: {safe_description}",
+            private=False,
+            auto_init=True
+        )
+
+
+def enable_pages(repo_name, branch):
+    with metrics.span("pages_enable"):
+        if pages.enable(repo_name, branch):
+            print(f"🌐 GitHub Pages enabled for {repo_name}")
+
+
+def mit_license():
+    return f"""MIT License
+
+Copyright (c) {time.strftime('%Y')} {GITHUB_USERNAME}
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+"""
+
 
 
-def push_to_github_update(task, brief, generated_files, nonce):
+
+def push_to_github_update(task, brief, generated_files, nonce, attachments=()):
     """
     Updates an existing GitHub repo (based on nonce).
     Fetches the repo, updates existing files, adds new ones if needed,
@@ -466,41 +804,56 @@ def push_to_github_update(task, brief, generated_files, nonce):
     """
     try:
         print(f"\n🔁 Updating repo for task: {task}")
+        generated_files = {**attachments_mod.files_for_repo(attachments), **generated_files}
 
         # --- Load nonce tracker ---
-        with open(NONCE_TRACKER_FILE, "r", encoding="utf-8") as f:
-            nonce_data = json.load(f)
+        record = nonce_store.get(nonce)
 
-        existing_repo_url = nonce_data[nonce]["repo_url"]
-        pages_url = nonce_data[nonce]["pages_url"]
+        existing_repo_url = record["repo_url"]
+        pages_url = record["pages_url"]
+        previous_sha = record["commit_sha"]
         repo_name = existing_repo_url.split("/")[-1]
 
-        g = Github(GITHUB_TOKEN)
-        repo = g.get_repo(f"{GITHUB_USERNAME}/{repo_name}")
-        commit_sha = None
+        repo = None
 
-        # --- Update or add files ---
-        for filename, content in generated_files.items():
-            try:
-                existing = repo.get_contents(filename)
-                result = repo.update_file(
-                    path=filename,
-                    message=f"Update {filename}",
-                    content=content,
-                    sha=existing.sha,
-                    branch="main"
-                )
-                commit_sha = result["commit"].sha
-                print(f"✅ Updated {filename}")
-            except Exception:
-                result = repo.create_file(
-                    path=filename,
-                    message=f"Add new file {filename}",
-                    content=content,
-                    branch="main"
-                )
-                commit_sha = result["commit"].sha
-                print(f"🆕 Added new file {filename}")
+        # --- Compare local git blob hashes with the current tree ---
+        previous_files = snapshots.recall(previous_sha)
+        binary_files = [path for path, code in generated_files.items() if isinstance(code, bytes)]
+        if previous_files is not None and not binary_files:  # the cache holds text files only
+            existing_shas = {path: snapshots.blob_sha(code) for path, code in previous_files.items()}
+        else:
+            repo = github_call("get_repo", get_github().get_repo, f"{GITHUB_USERNAME}/{repo_name}")
+            tree = github_call("get_tree", repo.get_git_tree, repo.default_branch, recursive=True)
+            existing_shas = {e.path: e.sha for e in tree.tree if e.type == "blob"}
+
+        changed_files = {
+            path: code for path, code in generated_files.items()
+            if existing_shas.get(path) != snapshots.blob_sha(code)
+        }
+        skipped = len(generated_files) - len(changed_files)
+        if skipped:
+            print(f"⏭️ Skipping {skipped} unchanged file(s)")
+
+        if not changed_files:
+            if previous_sha is None:
+                repo = repo or github_call("get_repo", get_github().get_repo, f"{GITHUB_USERNAME}/{repo_name}")
+                previous_sha = github_call("get_ref", repo.get_git_ref, f"heads/{repo.default_branch}").object.sha
+                nonce_store.put(nonce, commit_sha=previous_sha)
+            print(f"✅ Nothing changed, keeping commit {previous_sha}")
+            return existing_repo_url, pages_url, previous_sha
+
+        # --- Update or add the changed files in a single commit ---
+        repo = repo or github_call("get_repo", get_github().get_repo, f"{GITHUB_USERNAME}/{repo_name}")
+        with metrics.span("commit", files=len(changed_files)):
+            commit_sha = commit_files(repo, changed_files, f"Update {', '.join(changed_files)}")
+        print(f"✅ Committed {len(changed_files)} file(s) in {commit_sha}")
+
+        # --- Keep the snapshot cache and nonce tracker in step with the new commit ---
+        if previous_files is not None:
+            previous_files.update(changed_files)
+            snapshots.remember(commit_sha, previous_files)
+
+        nonce_store.put(nonce, commit_sha=commit_sha)
 
         print(f"✅ Repo updated successfully: {existing_repo_url}")
         print(f"🌐 GitHub Pages URL: {pages_url}")
@@ -514,55 +867,83 @@ def push_to_github_update(task, brief, generated_files, nonce):
 
 
 
+# commit many files at once through the Git Data API
+def commit_files(repo, files, message, replace=False, encoded=None):
+    """
+    Writes all files as one commit on the default branch
+    (tree -> commit -> ref update) and returns the new commit sha.
+    Text is inlined into the tree; bytes are uploaded as base64 blobs first,
+    concurrently with reading the branch head. `encoded` is encode_blobs(files)
+    when the caller has already prepared it.
+    With replace=True the tree holds only `files` (drops the auto_init README).
+    """
+    from github import InputGitTreeElement
+
+    if encoded is None:
+        encoded = encode_blobs(files)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(BLOB_UPLOAD_WORKERS, len(encoded)))) as pool:
+        uploads = {
+            path: pool.submit(
+                contextvars.copy_context().run, github_call, "create_blob", repo.create_git_blob, data, "base64"
+            )
+            for path, data in encoded.items()
+        }
+        ref = github_call("get_ref", repo.get_git_ref, f"heads/{repo.default_branch}")
+        parent = github_call("get_commit", repo.get_git_commit, ref.object.sha)
+
+        elements = []
+        for path, content in files.items():
+            if path in uploads:
+                elements.append(InputGitTreeElement(path, "100644", "blob", sha=uploads[path].result().sha))
+            else:
+                elements.append(InputGitTreeElement(path, "100644", "blob", content=content))
+
+    if replace:
+        tree = github_call("create_tree", repo.create_git_tree, elements)
+    else:
+        tree = github_call("create_tree", repo.create_git_tree, elements, base_tree=parent.tree)
+    commit = github_call("create_commit", repo.create_git_commit, message, tree, [parent])
+    github_call("update_ref", ref.edit, commit.sha)
+    return commit.sha
+
+
+def encode_blobs(files):
+    """Base64 payloads for the binary (bytes) files, which need their own blobs."""
+    return {
+        path: base64.b64encode(content).decode("ascii")
+        for path, content in files.items() if isinstance(content, bytes)
+    }
+
+
+
 # extract only the code blocks and no starter and ending chit chat form the llm
 def extract_code_blocks(llm_output: str,brief: str):
     """
     Extracts only code content from the LLM output.
     Returns a dictionary {filename: code}.
     """
-    code_blocks = re.findall(r"```(?:([\w\.\-\/]+)?\n)?(.*?)```", llm_output, re.DOTALL)
-    files = {}
-    file_counter = 1
-    for meta, code in code_blocks:
-        filename = meta.strip() if meta and "." in meta else f"file_{file_counter}.html"
-        files[filename] = code.strip()
-        file_counter += 1
-    # If no code blocks detected, treat full output as one HTML file
-    if not files and llm_output.strip():
-        brief_lower = brief.lower()
-
-        if "javascript" in brief_lower or "js" in brief_lower:
-            default_name = "script.js"
-        elif "css" in brief_lower or "style" in brief_lower:
-            default_name = "style.css"
-        elif "python" in brief_lower or "py" in brief_lower:
-            default_name = "app.py"
-        elif "html" in brief_lower or "web page" in brief_lower or "website" in brief_lower:
-            default_name = "index.html"
-        else:
-            default_name = "output.txt"  # generic fallback
-
-        files[default_name] = llm_output.strip()
-
-    return files
+    parser = CodeBlockStream(brief)
+    parser.feed(llm_output)
+    return parser.finish()
 
 
 
 # get the existing files from the repo.
-def get_existing_code_from_repo(repo_url):
-    g = Github(GITHUB_TOKEN)
+def get_existing_code_from_repo(repo_url, commit_sha=None):
+    """
+    Returns {path: text} for the repo, served from the snapshot cache
+    when `commit_sha` is the last commit we pushed.
+    """
+    cached = snapshots.recall(commit_sha)
+    if cached is not None:
+        print(f"⚡ Using cached snapshot for {commit_sha}")
+        return cached
+
     repo_name = repo_url.split("/")[-1]
-    repo = g.get_repo(f"{GITHUB_USERNAME}/{repo_name}")
-    existing_files = {}
-
-    def fetch_contents(path=""):
-        contents = repo.get_contents(path)
-        for file in contents:
-            if file.type == "dir":
-                fetch_contents(file.path)  # recursive call
-            else:
-                existing_files[file.path] = file.decoded_content.decode("utf-8")
+    with metrics.span("snapshot_load"):
+        repo = github_call("get_repo", get_github().get_repo, f"{GITHUB_USERNAME}/{repo_name}")
+        return snapshots.load_snapshot(repo, commit_sha)
 
-    fetch_contents()
 
-    return existing_files
+IMPORTED = time.perf_counter()
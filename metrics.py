@@ -0,0 +1,152 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process Prometheus-style metrics and structured timing spans.
+# Each uvicorn worker keeps its own registry.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_help = {}
+
+# task / nonce / round of the request being processed (copied into to_thread calls)
+_tags = contextvars.ContextVar("span_tags", default={})
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, kind, text):
+    _help[name] = (kind, text)
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    with _lock:
+        key = _key(name, labels)
+        hist = _histograms.setdefault(key, [0] * len(BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist[i] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+def set_tags(**tags):
+    """Tags every span logged in the current context (e.g. task, nonce, round)."""
+    _tags.set({**_tags.get(), **tags})
+
+
+def tags():
+    """The tags set for the current context."""
+    return dict(_tags.get())
+
+
+def record_span(stage, duration, error=None, **extra):
+    """Observes one finished stage and logs it as a JSON line tagged with the current task."""
+    observe("tds_stage_duration_seconds", duration, stage=stage)
+    if error:
+        inc("tds_stage_errors_total", stage=stage)
+    record = {"span": stage, "duration_ms": round(duration * 1000, 2), **_tags.get(), **extra}
+    if error:
+        record["error"] = error
+    print(json.dumps(record, default=str))
+
+
+@contextmanager
+def span(stage, **extra):
+    """
+    Times a pipeline stage: observes tds_stage_duration_seconds{stage},
+    counts failures in tds_stage_errors_total{stage} and logs one JSON line.
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - started, error, **extra)
+
+
+@contextmanager
+def external_call(service, op):
+    """Counts calls and errors to GitHub / the LLM provider / evaluators."""
+    inc("tds_external_calls_total", service=service, op=op)
+    try:
+        yield
+    except BaseException:
+        inc("tds_external_errors_total", service=service, op=op)
+        raise
+
+
+def process_uptime():
+    """Seconds since this process started (Linux /proc), or None where that is unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 3)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render():
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    for name in sorted({n for n, _ in counters}):
+        kind, text = _help.get(name, ("counter", name))
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} counter"]
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+
+    for name in sorted({n for n, _ in histograms}):
+        kind, text = _help.get(name, ("histogram", name))
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} histogram"]
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(BUCKETS, hist):
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist[-1]}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {hist[-2]}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {hist[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+describe("tds_stage_duration_seconds", "histogram", "Duration of each pipeline stage")
+describe("tds_stage_errors_total", "counter", "Pipeline stages that raised")
+describe("tds_external_calls_total", "counter", "Calls to GitHub, the LLM provider and evaluators")
+describe("tds_external_errors_total", "counter", "Failed calls to GitHub, the LLM provider and evaluators")
+describe("tds_requests_total", "counter", "Task submissions by outcome")
+describe("tds_jobs_total", "counter", "Finished jobs by status")
+describe("tds_round_wait_timeouts_total", "counter", "Later rounds that gave up waiting for round 1 to create the repo")
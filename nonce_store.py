@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# SQLite (WAL) store for nonce -> repo tracking, shared by all uvicorn workers
+STATE_DB = os.getenv("STATE_DB", "state.db")
+NONCE_TRACKER_FILE = Path("nonce_tracker.json")
+
+FIELDS = ("task", "email", "repo_url", "pages_url", "commit_sha")
+
+_conn = None
+_lock = threading.RLock()
+_cache = {}
+_cache_version = None
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(STATE_DB, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS nonces (
+                nonce TEXT PRIMARY KEY,
+                task TEXT,
+                email TEXT,
+                repo_url TEXT,
+                pages_url TEXT,
+                commit_sha TEXT,
+                created_at REAL,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS nonces_task ON nonces(task);
+            CREATE INDEX IF NOT EXISTS nonces_email ON nonces(email);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            -- bumped by every change to nonces (from any process); other tables in STATE_DB leave it alone
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('nonces_version', '0');
+            CREATE TRIGGER IF NOT EXISTS nonces_version_insert AFTER INSERT ON nonces BEGIN
+                UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'nonces_version';
+            END;
+            CREATE TRIGGER IF NOT EXISTS nonces_version_update AFTER UPDATE ON nonces BEGIN
+                UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'nonces_version';
+            END;
+            CREATE TRIGGER IF NOT EXISTS nonces_version_delete AFTER DELETE ON nonces BEGIN
+                UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'nonces_version';
+            END;
+        """)
+        _conn = conn
+        _migrate_json(conn)
+    return _conn
+
+
+def _migrate_json(conn):
+    """One-time import of the legacy nonce_tracker.json file."""
+    if conn.execute("SELECT 1 FROM meta WHERE key='migrated_json'").fetchone():
+        return
+    count = 0
+    if NONCE_TRACKER_FILE.exists():
+        with open(NONCE_TRACKER_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for nonce, entry in legacy.items():
+                conn.execute(
+                    "INSERT OR IGNORE INTO nonces (nonce, task, email, repo_url, pages_url, commit_sha, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (nonce, *(entry.get(k) for k in FIELDS), now, now),
+                )
+                count += 1
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)", (str(now),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"📦 Migrated {count} nonce(s) from {NONCE_TRACKER_FILE} into {STATE_DB}")
+    else:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)", (str(time.time()),))
+
+
+def _check_cache(conn):
+    # nonces_version changes whenever any connection (e.g. another worker) writes to nonces;
+    # PRAGMA data_version would also change on every lease, claim and outbox write
+    global _cache_version
+    version = conn.execute("SELECT value FROM meta WHERE key = 'nonces_version'").fetchone()[0]
+    if version != _cache_version:
+        _cache.clear()
+        _cache_version = version
+
+
+def get(nonce):
+    """Returns the tracked record for a nonce as a dict, or None."""
+    with _lock:
+        conn = _connect()
+        _check_cache(conn)
+        if nonce in _cache:
+            return dict(_cache[nonce]) if _cache[nonce] else None
+        row = conn.execute("SELECT * FROM nonces WHERE nonce = ?", (nonce,)).fetchone()
+        record = dict(row) if row else None
+        _cache[nonce] = record
+        return dict(record) if record else None
+
+
+def put(nonce, **fields):
+    """
+    Inserts or updates a nonce record. Only the given fields are changed.
+    Returns the stored record.
+    """
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown nonce fields: {', '.join(sorted(unknown))}")
+    now = time.time()
+    cols = list(fields)
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            f"INSERT INTO nonces (nonce, {', '.join(cols + ['created_at', 'updated_at'])}) "
+            f"VALUES ({', '.join('?' * (len(cols) + 3))}) "
+            f"ON CONFLICT(nonce) DO UPDATE SET "
+            + ", ".join([f"{c} = excluded.{c}" for c in cols] + ["updated_at = excluded.updated_at"]),
+            (nonce, *fields.values(), now, now),
+        )
+        _cache.pop(nonce, None)
+    return get(nonce)
+
+
+def list_by_task(task):
+    with _lock:
+        rows = _connect().execute("SELECT * FROM nonces WHERE task = ? ORDER BY created_at", (task,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def list_by_email(email):
+    with _lock:
+        rows = _connect().execute("SELECT * FROM nonces WHERE email = ? ORDER BY created_at", (email,)).fetchall()
+    return [dict(r) for r in rows]
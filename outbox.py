@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import clients
+import metrics
+
+# Durable outbox for evaluation-server notifications (same SQLite file as the nonce store)
+STATE_DB = os.getenv("STATE_DB", "state.db")
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BASE_DELAY = float(os.getenv("OUTBOX_BASE_DELAY", "1"))
+OUTBOX_MAX_DELAY = float(os.getenv("OUTBOX_MAX_DELAY", "300"))
+OUTBOX_PER_HOST = int(os.getenv("OUTBOX_PER_HOST", "4"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "120"))
+OUTBOX_TIMEOUT = float(os.getenv("OUTBOX_TIMEOUT", "60"))
+
+OWNER = f"{os.getpid()}:{uuid.uuid4().hex}"  # this process, holder of the leases it claims
+
+_conn = None
+_lock = threading.Lock()
+_wakeup = None
+_loop = None  # the dispatcher's event loop
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(STATE_DB, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                host TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL,
+                lease_until REAL,
+                last_error TEXT,
+                created_at REAL,
+                updated_at REAL,
+                delivered_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS notifications_due ON notifications(status, next_attempt_at);
+        """)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(notifications)")}
+        if "lease_owner" not in columns:  # tables created before leases had owners
+            conn.execute("ALTER TABLE notifications ADD COLUMN lease_owner TEXT")
+        _conn = conn
+    return _conn
+
+
+def wake():
+    """Wakes the dispatcher to look for due notifications; safe to call from any thread."""
+    if _wakeup is None:
+        return
+    try:
+        _loop.call_soon_threadsafe(_wakeup.set)
+    except RuntimeError:  # the loop has closed
+        pass
+
+
+def _row(row):
+    record = dict(row)
+    record["payload"] = json.loads(record["payload"])
+    return record
+
+
+def enqueue(url, payload, delay=0):
+    """
+    Persists a notification for delivery and returns its id.
+    With a `delay` it is held until then, or until release() is called.
+    """
+    now = time.time()
+    with _lock:
+        cur = _connect().execute(
+            "INSERT INTO notifications (url, host, payload, status, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+            (url, urlsplit(url).netloc, json.dumps(payload), now + delay, now, now),
+        )
+        notification_id = cur.lastrowid
+    if not delay:
+        wake()
+    print(f"📮 Queued notification {notification_id} for {url}" + (f" (held up to {delay:.0f}s)" if delay else ""))
+    return notification_id
+
+
+def release(notification_id):
+    """Makes a held notification due now."""
+    now = time.time()
+    with _lock:
+        _connect().execute(
+            "UPDATE notifications SET next_attempt_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'pending' AND attempts = 0 AND next_attempt_at > ?",
+            (now, now, notification_id, now),
+        )
+    wake()
+
+
+def list_notifications(status=None, limit=100):
+    with _lock:
+        conn = _connect()
+        if status:
+            rows = conn.execute(
+                "SELECT * FROM notifications WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM notifications ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [_row(r) for r in rows]
+
+
+def replay(notification_id):
+    """Resets a notification (typically 'dead') to pending. Returns the record or None."""
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "UPDATE notifications SET status = 'pending', attempts = 0, next_attempt_at = ?, "
+            "lease_until = NULL, updated_at = ? WHERE id = ? AND status IN ('pending', 'dead')",
+            (now, now, notification_id),
+        )
+        row = conn.execute("SELECT * FROM notifications WHERE id = ?", (notification_id,)).fetchone()
+    wake()
+    return _row(row) if row else None
+
+
+def _claim_due(limit):
+    # Claim pending rows (or rows whose lease expired after a crash) for this process
+    now = time.time()
+    claimed = []
+    with _lock:
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT id FROM notifications WHERE (status = 'pending' AND next_attempt_at <= ?) "
+            "OR (status = 'delivering' AND lease_until < ?) ORDER BY next_attempt_at LIMIT ?",
+            (now, now, limit),
+        ).fetchall()
+        for (notification_id,) in rows:
+            cur = conn.execute(
+                "UPDATE notifications SET status = 'delivering', lease_owner = ?, lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND (status = 'pending' OR (status = 'delivering' AND lease_until < ?))",
+                (OWNER, now + OUTBOX_LEASE, now, notification_id, now),
+            )
+            if cur.rowcount:
+                row = conn.execute("SELECT * FROM notifications WHERE id = ?", (notification_id,)).fetchone()
+                claimed.append(_row(row))
+    return claimed
+
+
+def _extend_lease(notification_id):
+    """Extends this process's lease on a claimed row. Returns False if the lease was lost."""
+    now = time.time()
+    with _lock:
+        cur = _connect().execute(
+            "UPDATE notifications SET lease_until = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'delivering' AND lease_owner = ?",
+            (now + OUTBOX_LEASE, now, notification_id, OWNER),
+        )
+    return cur.rowcount == 1
+
+
+def _record_result(notification, error):
+    # Returns the attempt count, or None if another process has taken the row over meanwhile
+    now = time.time()
+    attempts = notification["attempts"] + 1
+    with _lock:
+        conn = _connect()
+        if error is None:
+            cur = conn.execute(
+                "UPDATE notifications SET status = 'delivered', attempts = ?, delivered_at = ?, "
+                "lease_until = NULL, last_error = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (attempts, now, now, notification["id"], OWNER),
+            )
+        elif attempts >= OUTBOX_MAX_ATTEMPTS:
+            cur = conn.execute(
+                "UPDATE notifications SET status = 'dead', attempts = ?, lease_until = NULL, "
+                "last_error = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (attempts, error, now, notification["id"], OWNER),
+            )
+        else:
+            # exponential backoff with full jitter
+            delay = random.uniform(0, min(OUTBOX_MAX_DELAY, OUTBOX_BASE_DELAY * 2 ** attempts))
+            cur = conn.execute(
+                "UPDATE notifications SET status = 'pending', attempts = ?, next_attempt_at = ?, "
+                "lease_until = NULL, last_error = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (attempts, now + delay, error, now, notification["id"], OWNER),
+            )
+    return attempts if cur.rowcount == 1 else None
+
+
+class Dispatcher:
+    """Background task that delivers due notifications with per-host concurrency limits."""
+
+    def __init__(self, per_host=OUTBOX_PER_HOST, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.per_host = per_host
+        self.poll_interval = poll_interval
+        self._semaphores = {}
+        self._inflight = set()
+        self._task = None
+
+    async def start(self):
+        global _wakeup, _loop
+        _loop = asyncio.get_running_loop()
+        _wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        print("📬 Notification dispatcher started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._inflight, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            try:
+                capacity = 50 - len(self._inflight)
+                claimed = await asyncio.to_thread(_claim_due, capacity) if capacity > 0 else []
+                for notification in claimed:
+                    task = asyncio.create_task(self._deliver(notification))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+            except Exception as e:
+                print(f"⚠️ Outbox poll failed: {e}")
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+
+    async def _keep_leased(self, notification_id, lost):
+        # renews the lease while the row waits for its host's slot and while it is delivered
+        while True:
+            await asyncio.sleep(OUTBOX_LEASE / 3)
+            if not await asyncio.to_thread(_extend_lease, notification_id):
+                lost.set()
+                return
+
+    async def _deliver(self, notification):
+        host = notification["host"]
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.per_host))
+        lost = asyncio.Event()
+        renewing = asyncio.create_task(self._keep_leased(notification["id"], lost))
+        try:
+            attempts, error = await self._send(notification, semaphore, lost)
+        finally:
+            renewing.cancel()
+        if attempts is None:
+            print(f"⚠️ Lost the lease on notification {notification['id']}, leaving it to its new owner")
+        elif error is None:
+            print(f"✅ Successfully notified evaluation server: {notification['url']}")
+        elif attempts >= OUTBOX_MAX_ATTEMPTS:
+            print(f"💀 Notification {notification['id']} dead after {attempts} attempts: {error}")
+        else:
+            print(f"⚠️ Notification {notification['id']} attempt {attempts} failed: {error}, will retry")
+
+    async def _send(self, notification, semaphore, lost):
+        """Delivers once a host slot is free; returns (attempts, error), attempts None if the lease was lost."""
+        error = None
+        async with semaphore:
+            if lost.is_set() or not await asyncio.to_thread(_extend_lease, notification["id"]):
+                return None, None
+            started = time.perf_counter()
+            metrics.inc("tds_external_calls_total", service="evaluator", op="notify")
+            try:
+                response = await clients.async_http().post(
+                    notification["url"], json=notification["payload"],
+                    headers={"Content-Type": "application/json"}, timeout=OUTBOX_TIMEOUT,
+                )
+                if response.status_code != 200:
+                    error = f"HTTP {response.status_code}"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            if error:
+                metrics.inc("tds_external_errors_total", service="evaluator", op="notify")
+            payload = notification["payload"]
+            metrics.record_span(
+                "notify_delivery", time.perf_counter() - started, error,
+                task=payload.get("task"), nonce=payload.get("nonce"), round=payload.get("round"),
+                attempt=notification["attempts"] + 1,
+            )
+        return await asyncio.to_thread(_record_result, notification, error), error
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+
+import clients
+import metrics
+import outbox
+
+# GitHub Pages build watching: the evaluation notification is held until the site is live
+PAGES_BUILD_TIMEOUT = float(os.getenv("PAGES_BUILD_TIMEOUT", "300"))
+PAGES_POLL_INTERVAL = float(os.getenv("PAGES_POLL_INTERVAL", "5"))
+
+GITHUB_USERNAME = os.getenv("GITHUB_USERNAME")
+
+
+def enable(repo_name, branch):
+    """Turns on Pages for the repo's branch. Returns True if Pages is (already) enabled."""
+    response = clients.github_call(
+        "enable_pages", clients.http().post,
+        f"{clients.GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}/pages",
+        headers=clients.github_headers(),
+        json={"source": {"branch": branch, "path": "/"}},
+    )
+    if response.status_code in (201, 409):  # 409: already enabled
+        return True
+    print(f"⚠️ Enabling Pages for {repo_name} failed: HTTP {response.status_code} {response.text[:200]}")
+    return False
+
+
+async def latest_build(repo_name):
+    """Returns GitHub's latest Pages build for the repo, or None if there is none yet."""
+    response = await clients.github_async(
+        "get_pages_build", "GET",
+        f"{clients.GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}/pages/builds/latest",
+    )
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+async def wait_for_build(repo_name, commit_sha, timeout=PAGES_BUILD_TIMEOUT, interval=PAGES_POLL_INTERVAL):
+    """
+    Polls until the Pages build of `commit_sha` has finished.
+    Returns "built", "errored" or "timeout".
+    """
+    deadline = time.monotonic() + timeout
+    delay = min(1.0, interval)
+    while True:
+        build = await latest_build(repo_name)
+        if build and build.get("commit") == commit_sha and build.get("status") in ("built", "errored"):
+            return build["status"]
+        if time.monotonic() + delay > deadline:
+            return "timeout"
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, interval)
+
+
+class BuildWatcher:
+    """
+    Background tasks that wait for a commit's Pages build and then release its
+    held notification. If the process dies first, the outbox sends it at the deadline.
+    """
+
+    def __init__(self):
+        self._tasks = set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def watch(self, repo_name, commit_sha, notification_id, job=None):
+        task = asyncio.create_task(self._watch(repo_name, commit_sha, notification_id, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _watch(self, repo_name, commit_sha, notification_id, job):
+        started = time.monotonic()
+        try:
+            status = await wait_for_build(repo_name, commit_sha)
+        except Exception as e:
+            status = f"error: {e}"
+        duration = time.monotonic() - started
+        metrics.record_span(
+            "pages_build", duration, None if status == "built" else status, commit=commit_sha
+        )
+        if job is not None:
+            job.metrics["pages_status"] = status
+            job.metrics["pages_build_seconds"] = round(duration, 3)
+
+        if status == "built":
+            print(f"🌐 Pages live for {repo_name}@{commit_sha[:7]} after {duration:.1f}s")
+        else:
+            print(f"⚠️ Pages build for {repo_name}@{commit_sha[:7]}: {status}, notifying anyway")
+        await asyncio.to_thread(outbox.release, notification_id)
@@ -0,0 +1,121 @@
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import snapshots
+
+# Token budget for the existing-code section of update prompts
+UPDATE_CONTEXT_TOKENS = int(os.getenv("UPDATE_CONTEXT_TOKENS", "12000"))
+SUMMARY_LINES = int(os.getenv("CONTEXT_SUMMARY_LINES", "20"))
+SUMMARY_CACHE_SIZE = 512
+
+# Boilerplate the LLM never needs to see
+EXCLUDED_FILES = {"LICENSE", "LICENSE.md", "LICENSE.txt", ".gitignore", ".nojekyll"}
+# Files the update round almost always touches
+CORE_FILES = {"index.html": 3.0, "script.js": 2.5, "styles.css": 2.0, "style.css": 2.0, "README.md": 2.0}
+
+_WORD = re.compile(r"[a-zA-Z_][a-zA-Z0-9_\-]{2,}")
+_OUTLINE = re.compile(
+    r"^\s*(?:#{1,6}\s.+|(?:export\s+)?(?:async\s+)?function\s+\w+.*|(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?\(.*|"
+    r"class\s+\w+.*|def\s+\w+.*|<(?:section|header|main|footer|nav|form|table|canvas|h[1-6])\b.*|[.#]?[\w\-]+\s*\{)\s*$"
+)
+_summaries = OrderedDict()
+_encoding = False  # tiktoken encoding, None if unavailable; loaded on the first count_tokens call
+_lock = threading.Lock()  # contexts are built in worker threads
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is False:
+        with _lock:
+            if _encoding is False:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:  # optional dependency, fall back to a chars/4 estimate
+                    _encoding = None
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def _keywords(text):
+    return {w.lower() for w in _WORD.findall(text or "")}
+
+
+def _score(path, code, keywords):
+    name = os.path.basename(path)
+    score = CORE_FILES.get(name, 0.0)
+    if keywords:
+        path_words = _keywords(path.replace("/", " ").replace(".", " "))
+        code_words = _keywords(code)
+        score += 2.0 * len(keywords & path_words) / len(keywords)
+        score += 5.0 * len(keywords & code_words) / len(keywords)
+    return score
+
+
+def summarize(path, code):
+    """
+    Cheap structural outline of a file (headings, functions, selectors, tags),
+    cached by git blob sha so unchanged files are never re-summarized.
+    """
+    key = snapshots.blob_sha(code)
+    with _lock:
+        if key in _summaries:
+            _summaries.move_to_end(key)
+            return _summaries[key]
+
+    lines = code.splitlines()
+    outline = [line.rstrip() for line in lines if _OUTLINE.match(line)]
+    if not outline:
+        outline = [line.rstrip() for line in lines[:SUMMARY_LINES]]
+    if len(outline) > SUMMARY_LINES * 3:
+        outline = outline[:SUMMARY_LINES * 3] + ["..."]
+    summary = f"({len(lines)} lines, {count_tokens(code)} tokens)\n" + "\n".join(outline)
+
+    with _lock:
+        _summaries[key] = summary
+        while len(_summaries) > SUMMARY_CACHE_SIZE:
+            _summaries.popitem(last=False)
+    return summary
+
+
+def build_update_context(files, brief, checks=None, budget=UPDATE_CONTEXT_TOKENS):
+    """
+    Returns (context_text, stats) for the EXISTING CODEBASE section of an update prompt.
+    Files are ranked by relevance to the brief and checks and included in full while
+    they fit the token budget; the rest are replaced by cached summaries.
+    """
+    keywords = _keywords(brief) | _keywords(" ".join(str(c) for c in checks or []))
+    candidates = [(p, c) for p, c in files.items() if os.path.basename(p) not in EXCLUDED_FILES]
+    ranked = sorted(candidates, key=lambda item: _score(item[0], item[1], keywords), reverse=True)
+
+    sections = []
+    remaining = budget
+    used = 0
+    stats = {"full": [], "summarized": [], "excluded": len(files) - len(candidates)}
+    for path, code in ranked:
+        tokens = count_tokens(code)
+        if tokens <= remaining:
+            sections.append(f"--- {path} ---\n{code}")
+            cost = tokens
+            stats["full"].append(path)
+        else:
+            summary = summarize(path, code)
+            if count_tokens(summary) > remaining:
+                summary = f"({len(code.splitlines())} lines, {tokens} tokens, omitted)"
+            sections.append(f"--- {path} (summary only, full content omitted) ---\n{summary}")
+            cost = count_tokens(summary)
+            stats["summarized"].append(path)
+        remaining = max(0, remaining - cost)
+        used += cost
+
+    stats["tokens"] = used
+    return "\n".join(sections), stats
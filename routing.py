@@ -0,0 +1,182 @@
+"""
+Model routing: estimates how complex a task is and sends simple ones
+(e.g. small round-2 edits) to a faster, cheaper model.
+
+Each decision is appended to ROUTING_LOG with the latency and tokens it
+cost. Summarize that log to tune the rules:
+
+    python routing.py .cache/routing.jsonl
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import metrics
+from prompt_context import count_tokens
+
+LLM_MODEL = os.getenv("LLM_MODEL", "anthropic/claude-sonnet-4.5")
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "openai/gpt-4.1-mini")
+LLM_ROUTING = os.getenv("LLM_ROUTING", "1").lower() in ("1", "true", "yes")
+ROUTING_LOG = os.getenv("ROUTING_LOG", ".cache/routing.jsonl")  # "" to disable
+
+# First matching rule wins; tasks matching none use LLM_MODEL.
+# A rule matches on "round" and on "max_<feature>" limits for any feature below.
+DEFAULT_RULES = [
+    {"name": "small-update", "round": 2, "max_score": 6, "max_attachments": 0},
+]
+FEATURES = ("score", "brief_words", "checks", "attachments", "attachment_bytes", "existing_chars")
+
+_log_lock = threading.Lock()
+
+
+def load_rules(value=None):
+    """
+    Parses ROUTING_RULES: a JSON list of rules, or the path of a file holding one.
+    Raises ValueError on unknown keys so a typo does not silently route everything.
+    """
+    value = os.getenv("ROUTING_RULES", "") if value is None else value
+    if not value.strip():
+        return [dict(rule) for rule in DEFAULT_RULES]
+    if not value.lstrip().startswith("["):
+        value = Path(value).read_text(encoding="utf-8")
+    rules = json.loads(value)
+    allowed = {"name", "model", "round"} | {f"max_{f}" for f in FEATURES}
+    for i, rule in enumerate(rules):
+        unknown = set(rule) - allowed
+        if unknown:
+            raise ValueError(f"ROUTING_RULES[{i}]: unknown keys {sorted(unknown)}")
+        rule.setdefault("name", f"rule-{i}")
+    return rules
+
+
+ROUTING_RULES = load_rules()
+
+
+def features(data, existing_files=None):
+    """Complexity signals of a task payload (plus the repo files a round-2 update starts from)."""
+    attachments = data.get("attachments") or []
+    brief_words = len((data.get("brief") or "").split())
+    checks = len(data.get("checks") or [])
+    existing_chars = sum(len(code) for code in (existing_files or {}).values() if isinstance(code, str))
+    return {
+        "round": data.get("round"),
+        # roughly: 20 words of brief ~ one check ~ 5000 chars of existing code; attachments count double
+        "score": round(brief_words / 20 + checks + 2 * len(attachments) + existing_chars / 5000, 2),
+        "brief_words": brief_words,
+        "checks": checks,
+        "attachments": len(attachments),
+        "attachment_bytes": sum(a.get("size", 0) for a in attachments),
+        "existing_chars": existing_chars,
+    }
+
+
+def _matches(rule, signals):
+    if "round" in rule and rule["round"] != signals["round"]:
+        return False
+    return all(signals[f] <= rule[f"max_{f}"] for f in FEATURES if f"max_{f}" in rule)
+
+
+def route(data, existing_files=None, rules=None):
+    """
+    Picks the model for a task. Returns the decision:
+    {rule, model, fallbacks, features}; fallbacks hold LLM_MODEL when a cheaper model was chosen.
+    """
+    signals = features(data, existing_files)
+    rule, model = "default", LLM_MODEL
+    if LLM_ROUTING:
+        for candidate in ROUTING_RULES if rules is None else rules:
+            if _matches(candidate, signals):
+                rule, model = candidate["name"], candidate.get("model", LLM_FAST_MODEL)
+                break
+    metrics.inc("tds_route_decisions_total", rule=rule, model=model)
+    print(f"🧭 Routing to {model} ({rule}, complexity {signals['score']})")
+    return {
+        "rule": rule,
+        "model": model,
+        "fallbacks": [LLM_MODEL] if model != LLM_MODEL else [],
+        "features": signals,
+    }
+
+
+def record(decision, response, seconds, messages, cached=False):
+    """
+    Logs how a routing decision played out: the model that answered, latency and tokens
+    (from the provider's usage, or estimated when it sends none). Returns the log entry.
+    """
+    usage = response.get("usage") or {}
+    content = response["choices"][0]["message"]["content"]
+    entry = {
+        "ts": round(time.time(), 3),
+        "rule": decision["rule"],
+        "model": decision["model"],
+        "answered_by": response.get("model", decision["model"]),
+        "cached": cached,
+        "latency_seconds": round(seconds, 3),
+        "prompt_tokens": usage.get("prompt_tokens") or count_tokens("".join(m["content"] for m in messages)),
+        "completion_tokens": usage.get("completion_tokens") or count_tokens(content),
+        "tokens_estimated": not usage,
+        **decision["features"],
+        **metrics.tags(),
+    }
+    if not cached:
+        metrics.observe("tds_route_llm_seconds", seconds, rule=entry["rule"], model=entry["answered_by"])
+        for kind in ("prompt", "completion"):
+            metrics.inc("tds_route_tokens_total", entry[f"{kind}_tokens"], model=entry["answered_by"], kind=kind)
+    print(json.dumps({"route": entry["rule"], **entry}, default=str))
+
+    if ROUTING_LOG:
+        path = Path(ROUTING_LOG)
+        with _log_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def summarize(entries):
+    """Per (rule, model): calls, p50/p95 latency, mean tokens and how often another model answered."""
+    groups = {}
+    for entry in entries:
+        if not entry.get("cached"):
+            groups.setdefault((entry["rule"], entry["model"]), []).append(entry)
+    summary = []
+    for (rule, model), group in sorted(groups.items()):
+        latencies = sorted(e["latency_seconds"] for e in group)
+        summary.append({
+            "rule": rule,
+            "model": model,
+            "calls": len(group),
+            "p50_seconds": latencies[len(latencies) // 2],
+            "p95_seconds": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            "mean_prompt_tokens": round(sum(e["prompt_tokens"] for e in group) / len(group)),
+            "mean_completion_tokens": round(sum(e["completion_tokens"] for e in group) / len(group)),
+            "mean_score": round(sum(e["score"] for e in group) / len(group), 2),
+            "fallback_rate": round(sum(e["answered_by"] != model for e in group) / len(group), 3),
+        })
+    return summary
+
+
+metrics.describe("tds_route_decisions_total", "counter", "LLM routing decisions per rule and model")
+metrics.describe("tds_route_llm_seconds", "histogram", "LLM latency of routed (uncached) calls")
+metrics.describe("tds_route_tokens_total", "counter", "Prompt and completion tokens per answering model")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize routing decisions from a ROUTING_LOG file")
+    parser.add_argument("path", nargs="?", default=ROUTING_LOG or ".cache/routing.jsonl")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+    with open(args.path, encoding="utf-8") as f:
+        rows = summarize(json.loads(line) for line in f if line.strip())
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'rule':<16} {'model':<32} {'calls':>6} {'p50 s':>8} {'p95 s':>8} "
+              f"{'prompt':>8} {'output':>8} {'score':>6} {'fallback':>8}")
+        for r in rows:
+            print(f"{r['rule']:<16} {r['model']:<32} {r['calls']:>6} {r['p50_seconds']:>8} {r['p95_seconds']:>8} "
+                  f"{r['mean_prompt_tokens']:>8} {r['mean_completion_tokens']:>8} {r['mean_score']:>6} "
+                  f"{r['fallback_rate']:>8}")
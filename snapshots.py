@@ -0,0 +1,110 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from clients import github_call
+
+# Repo snapshots ({path: text}) keyed by commit sha
+SNAPSHOT_CACHE_DIR = Path(os.getenv("SNAPSHOT_CACHE_DIR", ".cache/snapshots"))
+SNAPSHOT_CACHE_SIZE = int(os.getenv("SNAPSHOT_CACHE_SIZE", "64"))
+BLOB_FETCH_WORKERS = int(os.getenv("BLOB_FETCH_WORKERS", "8"))
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+
+def blob_sha(content):
+    """Git blob object id for text or bytes, as GitHub reports it in trees."""
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def remember(commit_sha, files):
+    """
+    Write-through cache: stores the text files of a commit
+    in memory and on disk so later update rounds can skip GitHub reads.
+    """
+    if not commit_sha:
+        return
+    files = {path: code for path, code in files.items() if isinstance(code, str)}  # binary files are never shown to the LLM
+    with _lock:
+        _memory[commit_sha] = files
+        _memory.move_to_end(commit_sha)
+        while len(_memory) > SNAPSHOT_CACHE_SIZE:
+            _memory.popitem(last=False)
+    try:
+        SNAPSHOT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = SNAPSHOT_CACHE_DIR / f"{commit_sha}.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(files, f)
+        os.replace(tmp, SNAPSHOT_CACHE_DIR / f"{commit_sha}.json")
+    except OSError as e:
+        print(f"⚠️ Could not persist snapshot {commit_sha}: {e}")
+
+
+def recall(commit_sha):
+    """Returns the cached {path: text} for a commit, or None."""
+    if not commit_sha:
+        return None
+    with _lock:
+        if commit_sha in _memory:
+            _memory.move_to_end(commit_sha)
+            return dict(_memory[commit_sha])
+    path = SNAPSHOT_CACHE_DIR / f"{commit_sha}.json"
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            files = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _lock:
+        _memory[commit_sha] = files
+        while len(_memory) > SNAPSHOT_CACHE_SIZE:
+            _memory.popitem(last=False)
+    return dict(files)
+
+
+def _fetch_blob(repo, sha):
+    blob = github_call("get_blob", repo.get_git_blob, sha)
+    data = base64.b64decode(blob.content) if blob.encoding == "base64" else blob.content.encode("utf-8")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None  # binary file, nothing useful to show the LLM
+
+
+def load_snapshot(repo, commit_sha=None):
+    """
+    Returns {path: text} for the repo's current state.
+    Uses the cache when `commit_sha` (the last commit we pushed) is known,
+    otherwise fetches the whole tree in one call and the blobs concurrently.
+    """
+    cached = recall(commit_sha)
+    if cached is not None:
+        print(f"⚡ Snapshot cache hit for {commit_sha}")
+        return cached
+
+    head_sha = github_call("get_ref", repo.get_git_ref, f"heads/{repo.default_branch}").object.sha
+    cached = recall(head_sha)
+    if cached is not None:
+        print(f"⚡ Snapshot cache hit for {head_sha}")
+        return cached
+
+    tree = github_call("get_tree", repo.get_git_tree, head_sha, recursive=True)
+    if tree.raw_data.get("truncated"):
+        print(f"⚠️ Tree for {repo.full_name} is truncated, snapshot is partial")
+    blobs = [e for e in tree.tree if e.type == "blob"]
+
+    with ThreadPoolExecutor(max_workers=BLOB_FETCH_WORKERS) as pool:
+        contents = list(pool.map(lambda e: _fetch_blob(repo, e.sha), blobs))
+
+    files = {e.path: text for e, text in zip(blobs, contents) if text is not None}
+    remember(head_sha, files)
+    print(f"📥 Loaded {len(files)} file(s) from {repo.full_name}@{head_sha[:7]}")
+    return files
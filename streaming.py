@@ -0,0 +1,161 @@
+import json
+import re
+import time
+
+# Same filename pattern extract_code_blocks has always used after an opening fence
+_FENCE = "```"
+_META = re.compile(r"[\w\.\-\/]*")
+
+
+def default_filename(brief):
+    """Filename used when the LLM output contains no code blocks at all."""
+    brief_lower = brief.lower()
+
+    if "javascript" in brief_lower or "js" in brief_lower:
+        return "script.js"
+    elif "css" in brief_lower or "style" in brief_lower:
+        return "style.css"
+    elif "python" in brief_lower or "py" in brief_lower:
+        return "app.py"
+    elif "html" in brief_lower or "web page" in brief_lower or "website" in brief_lower:
+        return "index.html"
+    return "output.txt"  # generic fallback
+
+
+class CodeBlockStream:
+    """
+    Incremental, single-pass parser for ```filename fenced blocks.
+    Feed it text chunks as they arrive; `on_file(filename, content)` fires as soon
+    as a block's closing fence is seen. finish() returns the same dict
+    extract_code_blocks() produces for the full text.
+    """
+
+    def __init__(self, brief, on_file=None):
+        self.brief = brief
+        self.on_file = on_file
+        self.files = {}
+        self.fed = False
+        self.started_at = time.monotonic()
+        self.first_file_at = None
+        self.peak_buffer = 0
+        self.parse_seconds = 0.0
+        self._buf = ""
+        self._state = "outside"  # outside -> header -> body -> outside
+        self._meta = None
+        self._scan = 0
+        self._counter = 1
+        self._raw = []  # full text, kept only until the first block closes (for the fallback)
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        self.fed = True
+        if self._raw is not None:
+            self._raw.append(chunk)
+        self._buf += chunk
+        self.peak_buffer = max(self.peak_buffer, len(self._buf))
+        started = time.perf_counter()
+        self._parse(final=False)
+        self.parse_seconds += time.perf_counter() - started
+
+    def finish(self):
+        started = time.perf_counter()
+        self._parse(final=True)
+        self.parse_seconds += time.perf_counter() - started
+        if not self.files and self._raw is not None:
+            text = "".join(self._raw).strip()
+            if text:
+                self.files[default_filename(self.brief)] = text
+        return self.files
+
+    @property
+    def time_to_first_file(self):
+        return None if self.first_file_at is None else self.first_file_at - self.started_at
+
+    def _parse(self, final):
+        while True:
+            if self._state == "outside":
+                i = self._buf.find(_FENCE, self._scan)
+                if i < 0:
+                    # keep a possible partial fence at the end
+                    keep = len(self._buf) - (len(_FENCE) - 1)
+                    if keep > 0:
+                        self._buf = self._buf[keep:]
+                    self._scan = 0
+                    return
+                self._buf = self._buf[i + len(_FENCE):]
+                self._scan = 0
+                self._state = "header"
+
+            if self._state == "header":
+                end = _META.match(self._buf).end()
+                if end == len(self._buf) and not final:
+                    return  # can't tell yet whether a newline follows the name
+                if end < len(self._buf) and self._buf[end] == "\n":
+                    self._meta = self._buf[:end] or None
+                    self._buf = self._buf[end + 1:]
+                else:
+                    self._meta = None
+                self._state = "body"
+
+            if self._state == "body":
+                j = self._buf.find(_FENCE, self._scan)
+                if j < 0:
+                    self._scan = max(0, len(self._buf) - (len(_FENCE) - 1))
+                    return
+                self._emit(self._buf[:j])
+                self._buf = self._buf[j + len(_FENCE):]
+                self._scan = 0
+                self._state = "outside"
+
+    def _emit(self, code):
+        meta = self._meta
+        filename = meta.strip() if meta and "." in meta else f"file_{self._counter}.html"
+        self._counter += 1
+        content = code.strip()
+        self.files[filename] = content
+        self._raw = None
+        if self.first_file_at is None:
+            self.first_file_at = time.monotonic()
+        if self.on_file:
+            self.on_file(filename, content)
+
+
+async def stream_chat_completion(url, payload, headers, parser, client=None, on_headers=None, timeout=600):
+    """
+    Requests a streamed (SSE) chat completion, feeds every delta into `parser`
+    and returns a response shaped like the non-streaming API (with "usage" if the provider sends it).
+    Uses the given (pooled) `client` if any; `on_headers` receives the response headers.
+    """
+    if client is None:
+        import httpx
+
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            return await stream_chat_completion(url, payload, headers, parser, client, on_headers, timeout)
+
+    parts = []
+    usage = None
+    body = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+    async with client.stream("POST", url, json=body, headers=headers, timeout=timeout) as response:
+        if on_headers:
+            on_headers(response.headers)
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            usage = event.get("usage") or usage  # sent on the last chunk when include_usage is honoured
+            choices = event.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                parts.append(delta)
+                parser.feed(delta)
+
+    content = "".join(parts)
+    result = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+    if usage:
+        result["usage"] = usage
+    return result
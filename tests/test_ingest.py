@@ -0,0 +1,129 @@
+import asyncio
+import base64
+import json
+import random
+import re
+from urllib.parse import quote, unquote_to_bytes
+
+import pytest
+
+import attachments
+import ingest
+
+SECRET = "s"
+# characters json.dumps escapes, multi-byte UTF-8 and an astral character (a surrogate pair once escaped)
+_CHARS = ["a", " ", "/", '"', "\\", "\n", "\t", "\x01", "\u2028", "é", "中", "\U0001F600"]
+_LONE_SURROGATES = ["\ud83d", "\ude00"]
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(attachments, "ATTACHMENT_STORE_DIR", tmp_path)
+
+
+def _text(rng, ascii_only):
+    chars = _CHARS + _LONE_SURROGATES if ascii_only else _CHARS
+    return "".join(rng.choice(chars) for _ in range(rng.randint(0, 40)))
+
+
+def _payload(rng, ascii_only):
+    blob = rng.randbytes(rng.randint(0, 3000))
+    return {
+        "email": _text(rng, ascii_only),
+        "secret": SECRET,
+        "task": "t",
+        "round": 1,
+        "nonce": "n",
+        "brief": _text(rng, ascii_only),
+        "checks": [_text(rng, ascii_only), {"js": _text(rng, ascii_only)}],
+        "attachments": [
+            {"name": "blob.bin", "url": "data:application/octet-stream;base64," + base64.b64encode(blob).decode()},
+            {"name": "note.txt", "url": "data:text/plain," + quote(_text(rng, False), safe="/")},
+            {"name": _text(rng, ascii_only), "url": "https://example.com/" + _text(rng, ascii_only)},
+        ],
+    }
+
+
+def _encode(rng, payload, ascii_only):
+    body = json.dumps(payload, ensure_ascii=ascii_only)
+    if rng.random() < 0.5:
+        body = body.replace("/", "\\/")  # legal everywhere: "/" only occurs inside strings
+    if rng.random() < 0.5:
+        body = re.sub(r"(?<!\\)((?:\\\\)*)\\u([0-9a-f]{4})", lambda m: m[1] + "\\u" + m[2].upper(), body)
+    return body.encode("utf-8")
+
+
+def _split(rng, body):
+    cuts = sorted(rng.sample(range(1, len(body)), min(len(body) - 1, rng.randint(0, 60))))
+    return [body[i:j] for i, j in zip([0] + cuts, cuts + [len(body)])]
+
+
+def _read(pieces):
+    async def chunks():
+        for piece in pieces:
+            yield piece
+
+    return asyncio.run(ingest.read_task(chunks(), SECRET))
+
+
+def _decoded(url):
+    header, _, data = url.partition(",")
+    return base64.b64decode(data) if header.endswith(";base64") else unquote_to_bytes(data)
+
+
+def _assert_same(data, expected):
+    assert {k: v for k, v in data.items() if k != "attachments"} == \
+        {k: v for k, v in expected.items() if k != "attachments"}
+    assert len(data["attachments"]) == len(expected["attachments"])
+    for got, want in zip(data["attachments"], expected["attachments"]):
+        if want["url"].startswith("data:"):
+            assert got["name"] == want["name"]
+            assert attachments.read(got) == _decoded(want["url"])
+        else:
+            assert got == want
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_read_task_matches_json_loads(seed):
+    rng = random.Random(seed)
+    ascii_only = rng.random() < 0.7
+    body = _encode(rng, _payload(rng, ascii_only), ascii_only)
+    _assert_same(_read(_split(rng, body)), json.loads(body))
+
+
+@pytest.mark.parametrize("escapes", [
+    r"\ud83d\ude00",  # pair
+    r"\uD83D\uDE00",
+    r"\ud83d\ud83d\ude00",  # lone high surrogate, then a pair
+    r"\u00e9\ud83d\ude00",  # a plain escape before a pair
+    r"\u00e9\u0041",  # two plain escapes stay apart
+    r"\ude00\ud83d",  # low then high: two lone surrogates
+    r"\ud83dA",
+    r"\ud83d\n\/",
+])
+def test_url_escapes_at_every_split(escapes):
+    body = json.dumps({
+        "secret": SECRET, "task": "t", "round": 1, "nonce": "n", "brief": "b",
+        "attachments": [{"name": "x", "url": "https://example.com/@@"}],
+    }).replace("/", "\\/").replace("@@", escapes).encode("utf-8")
+    expected = json.loads(body)
+    for cut in range(1, len(body)):
+        _assert_same(_read([body[:cut], body[cut:]]), expected)
+
+
+@pytest.mark.parametrize("key", attachments.REFERENCE_KEYS)
+def test_client_cannot_supply_a_stored_reference(key):
+    forged = {"name": "leak.txt", "url": "https://example.com/", key: "/etc/hostname"}
+    payload = {"secret": SECRET, "task": "t", "round": 1, "nonce": "n", "brief": "b", "attachments": [forged]}
+    with pytest.raises(ingest.Rejected) as streamed:
+        _read([json.dumps(payload).encode("utf-8")])
+    assert streamed.value.status == 400
+    with pytest.raises(ingest.Rejected):
+        ingest.validate(payload, SECRET)  # the /batch path
+
+
+def test_only_committed_references_reach_the_repo():
+    forged = {"name": "leak.txt", "sha256": "/etc/hostname", "mime": "text/plain", "size": 1}
+    assert attachments.files_for_repo(attachments.store_all([forged])) == {}
+    with pytest.raises(ValueError):
+        attachments.read(forged)